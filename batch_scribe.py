@@ -0,0 +1,181 @@
+"""Headless batch scribe: turn a folder of consultation recordings into records and PDFs.
+
+    python batch_scribe.py recordings/ --doctor "Dr. Mehta" --workers 4
+
+Recordings are transcribed and extracted in parallel (at most --workers
+recordings at a time, with Groq calls paced by the shared groq_governor).
+Results are flushed in bulk: PDFs first, then one write to the patient
+archive, then the ledger. A recording is only marked done in
+the ledger once its record is archived, so re-running after an interruption
+picks up exactly the recordings that were not yet saved. Each archived row
+carries its recording key, so a crash between the archive write and the
+ledger append never archives a recording twice on resume. Formulary
+warnings for each recording's Rx are logged and kept in its ledger entry.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import scribe_core
+from groq_governor import governed
+from scribe_core import analyze_audio, build_record, clean_text_forcefully, create_pdf, make_client, save_records
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".ogg", ".flac", ".webm")
+LEDGER_NAME = "batch_ledger.jsonl"
+
+
+# 1. RESUME LEDGER
+def recording_key(path):
+    # Name + size + mtime: a re-uploaded file with the same name is processed again
+    st = os.stat(path)
+    return f"{os.path.basename(path)}|{st.st_size}|{st.st_mtime_ns}"
+
+def load_ledger(ledger_path):
+    done = set()
+    if not os.path.exists(ledger_path):
+        return done
+    with open(ledger_path, "r") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["key"])
+            except (ValueError, KeyError):
+                continue  # torn last line from an interrupted run
+    return done
+
+def append_ledger(ledger_path, entries):
+    with open(ledger_path, "a") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def find_recordings(folder):
+    paths = []
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if os.path.isfile(path) and name.lower().endswith(AUDIO_EXTENSIONS):
+            paths.append(path)
+    return paths
+
+
+# 2. PER-RECORDING WORK (runs in worker threads)
+def process_recording(client, doctor, path):
+    with open(path, "rb") as f:
+        audio = f.read()
+    fields = analyze_audio(governed(client, doctor), audio, os.path.basename(path))
+    vitals = {"BP": fields["bp"] or "--", "Pulse": fields["pulse"] or "--", "Weight": fields["weight"] or "--", "Temp": fields["temp"] or "--"}
+    # The visit happened when the device stopped recording, not when we batch it
+    when = datetime.fromtimestamp(os.path.getmtime(path))
+    record = build_record(
+        doctor, clean_text_forcefully(fields["name"]), fields["age"], "See Rx", fields["rx"], fields["notes"],
+        vitals["BP"], vitals["Pulse"], vitals["Weight"], vitals["Temp"], when=when
+    )
+    record["Recording"] = recording_key(path)
+    pdf_bytes = create_pdf(doctor, fields["name"], fields["age"], fields["rx"], fields["notes"], vitals, when=when)
+    return record, pdf_bytes, fields["rx_warnings"]
+
+
+# 3. BULK FLUSH
+def safe_filename_part(text):
+    # Names come from the LLM: "S/O", dots and quotes must never reach the filesystem
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", clean_text_forcefully(text)).strip("_")
+
+def pdf_filename(path, record):
+    stem = safe_filename_part(os.path.splitext(os.path.basename(path))[0]) or "recording"
+    patient = safe_filename_part(record["Patient Name"]) or "Unknown"
+    return f"{stem}_{patient}_Prescription.pdf"
+
+def write_pdf(pdf_dir, filename, pdf_bytes):
+    tmp = os.path.join(pdf_dir, filename + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(pdf_bytes)
+    os.replace(tmp, os.path.join(pdf_dir, filename))
+
+def flush(results, pdf_dir, ledger_path, log=print):
+    """Write PDFs, archive the records, then mark them done; returns rows newly archived."""
+    if not results: return 0
+    pdfs = {}
+    for path, record, pdf_bytes, _ in results:
+        # A PDF that cannot be written is logged; the visit is still archived
+        name = pdf_filename(path, record)
+        try:
+            write_pdf(pdf_dir, name, pdf_bytes)
+            pdfs[path] = name
+        except OSError as e:
+            log(f"PDF FAILED {os.path.basename(path)}: {e}")
+    saved = save_records([record for _, record, _, _ in results])
+    # Nobody reviews a batch before it is archived: keep the formulary warnings for follow-up
+    append_ledger(ledger_path, [
+        {"key": record["Recording"], "file": os.path.basename(path), "pdf": pdfs.get(path), "rx_warnings": warnings,
+         "archived_at": datetime.now().isoformat(timespec="seconds")}
+        for path, record, _, warnings in results
+    ])
+    results.clear()
+    return saved
+
+
+def run_batch(client, folder, doctor, out_dir, workers=4, batch_size=25, log=print):
+    os.makedirs(out_dir, exist_ok=True)
+    ledger_path = os.path.join(out_dir, LEDGER_NAME)
+    done = load_ledger(ledger_path)
+    pending = [p for p in find_recordings(folder) if recording_key(p) not in done]
+    log(f"{len(pending)} recording(s) to process, {len(done)} already archived.")
+
+    buffered, archived, failed = [], 0, []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_recording, client, doctor, p): p for p in pending}
+        try:
+            for fut in as_completed(futures):
+                path = futures[fut]
+                try:
+                    record, pdf_bytes, warnings = fut.result()
+                except Exception as e:
+                    failed.append(path)
+                    log(f"FAILED {os.path.basename(path)}: {e}")
+                    continue
+                buffered.append((path, record, pdf_bytes, warnings))
+                log(f"ok     {os.path.basename(path)} -> {record['Patient Name'] or '--'}")
+                for warning in warnings:
+                    log(f"  RX   {warning}")
+                if len(buffered) >= batch_size:
+                    archived += flush(buffered, out_dir, ledger_path, log)
+        except KeyboardInterrupt:
+            for fut in futures: fut.cancel()
+            log("Interrupted: saving finished recordings, re-run to resume.")
+            raise
+        finally:
+            archived += flush(buffered, out_dir, ledger_path, log)
+    return archived, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process a folder of consultation recordings without the Streamlit UI.")
+    parser.add_argument("folder", help="Directory of audio recordings")
+    parser.add_argument("--doctor", required=True, help="Physician name recorded on every visit")
+    parser.add_argument("--out", default="batch_output", help="Directory for PDFs and the resume ledger")
+    parser.add_argument("--db", default=scribe_core.DB_FILE, help="Patient archive CSV")
+    parser.add_argument("--workers", type=int, default=4, help="Max recordings processed concurrently")
+    parser.add_argument("--batch-size", type=int, default=25, help="Records buffered before each bulk write")
+    parser.add_argument("--api-key", default=os.environ.get("GROQ_API_KEY"), help="Groq API key (default: $GROQ_API_KEY)")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("no Groq API key: pass --api-key or set GROQ_API_KEY")
+    if not os.path.isdir(args.folder):
+        parser.error(f"not a directory: {args.folder}")
+
+    scribe_core.DB_FILE = args.db
+    try:
+        archived, failed = run_batch(make_client(args.api_key, max_retries=0), args.folder, args.doctor, args.out, max(1, args.workers), max(1, args.batch_size))
+    except KeyboardInterrupt:
+        return 130
+    print(f"Done: {archived} archived, {len(failed)} failed.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
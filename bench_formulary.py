@@ -0,0 +1,92 @@
+"""Latency benchmark for the formulary trie.
+
+    python bench_formulary.py                 # 50,000 entries
+    python bench_formulary.py --entries 200000
+
+Builds a synthetic formulary of the requested size (generic names, brand
+aliases, strengths), then times prefix autocomplete, fuzzy lookup of
+misheard names and full Rx-line normalisation.
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from formulary import FormularyTrie, normalize_rx_line
+
+SYLLABLES = ["pra", "zo", "lam", "ce", "ti", "ri", "zine", "mox", "cil", "lin", "dro", "xy", "met", "for", "min",
+             "ator", "va", "sta", "tin", "pan", "to", "pra", "zole", "flu", "cona", "lev", "o", "ami", "dip", "ine",
+             "sar", "tan", "cef", "ix", "ime", "gli", "cla", "zide", "ol", "bu", "ter", "nal", "dex", "amet", "ha"]
+STRENGTHS = ["5 mg", "10 mg", "20 mg", "40 mg", "50 mg", "100 mg", "250 mg", "500 mg", "650 mg"]
+
+
+def make_name(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 5))).capitalize()
+
+def typo(rng, word):
+    i = rng.randrange(1, len(word) - 1)
+    kind = rng.random()
+    if kind < 0.33: return word[:i] + word[i + 1:]                                   # drop
+    if kind < 0.66: return word[:i] + word[i + 1] + word[i] + word[i + 2:]           # swap
+    return word[:i] + rng.choice("aeioutnrs") + word[i + 1:]                         # substitute
+
+def timed(fn, inputs):
+    out = []
+    for x in inputs:
+        t0 = time.perf_counter()
+        fn(x)
+        out.append(time.perf_counter() - t0)
+    out.sort()
+    return out
+
+def report(label, samples):
+    pct = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1e6
+    print(f"{label:<22} p50 {pct(0.5):8.1f}us   p90 {pct(0.9):8.1f}us   p99 {pct(0.99):8.1f}us")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark formulary autocomplete and fuzzy lookup.")
+    parser.add_argument("--entries", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--memory", action="store_true", help="Trace allocations during the build (slows it down)")
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    names = set()
+    while len(names) < args.entries:
+        name = make_name(rng)
+        if rng.random() < 0.1: name += " " + make_name(rng)
+        names.add(name)
+    names = sorted(names)
+
+    rows = [(name, [make_name(rng)] if rng.random() < 0.3 else [], rng.sample(STRENGTHS, 3)) for name in names]
+    if args.memory: tracemalloc.start()
+    t0 = time.perf_counter()
+    trie = FormularyTrie()
+    for name, aliases, strengths in rows:
+        trie.add(name, aliases, strengths, "tablet")
+    build = time.perf_counter() - t0
+    memory = ""
+    if args.memory:
+        memory = f", ~{tracemalloc.get_traced_memory()[1] / 2**20:.0f} MiB peak"
+        tracemalloc.stop()
+    print(f"{len(trie):,} entries, {trie.node_count():,} trie nodes, built in {build:.2f}s{memory}")
+
+    picks = [rng.choice(names) for _ in range(args.queries)]
+    prefixes = [p[:rng.randint(2, 5)] for p in picks]
+    misheard = [typo(rng, p.split()[0]) for p in picks if len(p.split()[0]) >= 6]
+    lines = [f"Tab. {typo(rng, p.split()[0]) if len(p) >= 6 else p} 500mg BD for 5 days" for p in picks[:1000]]
+
+    report("autocomplete (top 10)", timed(lambda p: trie.complete(p, 10), prefixes))
+    report("exact lookup", timed(trie.exact, picks))
+    report("fuzzy lookup", timed(trie.lookup, misheard))
+    report("normalize Rx line", timed(lambda l: normalize_rx_line(l, trie), lines))
+
+    hits = sum(1 for word, pick in zip(misheard, (p for p in picks if len(p.split()[0]) >= 6))
+               if trie.lookup(word)[0] is not None and trie.entries[trie.lookup(word)[0]][0].split()[0] == pick.split()[0])
+    print(f"fuzzy recovered the intended drug for {hits / max(1, len(misheard)):.1%} of misheard names")
+
+
+if __name__ == "__main__":
+    main()
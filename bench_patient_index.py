@@ -0,0 +1,98 @@
+"""Benchmark for patient_index at archive scale.
+
+    python bench_patient_index.py                 # 1,000,000 visits
+    python bench_patient_index.py --visits 100000
+
+Generates synthetic visits for a known population, with the kinds of name
+drift the LLM produces (case, titles, initials, typos), feeds them through
+PatientIndex.assign() and reports throughput, per-visit latency, candidates
+scored per lookup (vs. the archive size a pairwise scan would compare) and
+linkage quality against the ground truth.
+"""
+import argparse
+import random
+import time
+from collections import Counter, defaultdict
+
+from patient_index import PatientIndex
+
+ONSETS = ["r", "s", "m", "p", "k", "a", "v", "n", "d", "g", "h", "j", "t", "b", "l", "y", "sh", "ch", "pr", "sr"]
+VOWELS = ["a", "e", "i", "o", "u", "aa", "ee"]
+CODAS = ["", "n", "m", "sh", "r", "l", "t", "v", "j", "k"]
+TITLES = ["", "", "", "Mr. ", "Mrs. ", "Shri ", "Smt. "]
+
+
+def make_name(rng, syllables):
+    return "".join(rng.choice(ONSETS) + rng.choice(VOWELS) + rng.choice(CODAS) for _ in range(syllables)).capitalize()
+
+def make_population(rng, size, year):
+    firsts = list({make_name(rng, rng.choice((2, 2, 3))) for _ in range(4000)})
+    surnames = list({make_name(rng, rng.choice((1, 2, 2))) for _ in range(1500)})
+    return [(rng.choice(firsts), rng.choice(surnames), year - rng.randint(1, 90)) for _ in range(size)]
+
+def typo(rng, word):
+    if len(word) < 5: return word
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+def render(rng, first, surname):
+    roll = rng.random()
+    if roll < 0.55: name = f"{first} {surname}"
+    elif roll < 0.75: name = f"{first.lower()} {surname.lower()}"
+    elif roll < 0.85: name = f"{first[0]}. {surname}"
+    elif roll < 0.93: name = f"{typo(rng, first)} {surname}"
+    else: name = f"{first} {typo(rng, surname)}"
+    return rng.choice(TITLES) + name
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the patient identity index.")
+    parser.add_argument("--visits", type=int, default=1_000_000)
+    parser.add_argument("--visits-per-patient", type=float, default=3.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    year = 2025
+    people = make_population(rng, max(1, int(args.visits / args.visits_per_patient)), year)
+    print(f"{args.visits:,} visits from {len(people):,} synthetic patients")
+
+    visits = []
+    for _ in range(args.visits):
+        truth = rng.randrange(len(people))
+        first, surname, born = people[truth]
+        visit_year = rng.randint(year - 5, year)
+        age = "--" if rng.random() < 0.05 else str(visit_year - born + rng.choice((0, 0, 0, 1, -1)))
+        visits.append((truth, render(rng, first, surname), age, f"{visit_year}-06-01"))
+
+    idx = PatientIndex()
+    latencies = []
+    assigned = []
+    started = time.perf_counter()
+    for truth, name, age, date in visits:
+        t0 = time.perf_counter()
+        assigned.append(idx.assign(name, age, date))
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"throughput      {args.visits / elapsed:,.0f} visits/s ({elapsed:.1f}s total)")
+    print(f"latency         p50 {percentile(latencies, 0.5) * 1e6:.0f}us  p99 {percentile(latencies, 0.99) * 1e6:.0f}us  max {latencies[-1] * 1e3:.1f}ms")
+    print(f"candidates      {idx.probes / args.visits:.1f} scored per visit (pairwise would compare up to {len(idx):,})")
+
+    # Purity: share of visits whose ID's majority truth patient is their own
+    by_pid = defaultdict(Counter)
+    ids_per_truth = defaultdict(set)
+    for (truth, _, _, _), pid in zip(visits, assigned):
+        by_pid[pid][truth] += 1
+        ids_per_truth[truth].add(pid)
+    pure = sum(c.most_common(1)[0][1] for c in by_pid.values())
+    split = sum(len(ids) for ids in ids_per_truth.values()) / len(ids_per_truth)
+    print(f"linkage         {len(idx):,} IDs for {len(ids_per_truth):,} real patients | purity {pure / args.visits:.2%} | {split:.2f} IDs per real patient")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Streaming export of the patient archive to CSV, NDJSON or a FHIR-style bundle.
+
+    python export.py --format fhir --start 2024-01-01 --end 2024-03-31 --out q1.json
+
+Records are read from the store in fixed-size chunks and pushed through a
+generator pipeline (read -> filter by date -> clean -> serialise), so memory
+stays flat no matter how large patient_records.csv grows. Every format is
+produced as an iterator of text pieces; the CLI writes them to a file or
+stdout and the Archive page spools them to disk for download. Streamlit's
+download button holds the whole file in memory, so the Archive page caps
+its exports at ASCLEPIUS_UI_EXPORT_MB; larger ones go through the CLI.
+
+FHIR fullUrls are derived from stable fields (the Patient ID; a visit's
+date, time, doctor, patient and recording), so the same visit keeps the
+same URLs in every export and a receiving EMR can de-duplicate imports.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+import pandas as pd
+
+import scribe_core
+from scribe_core import COLUMNS, clean_nan, clean_text_forcefully
+
+FORMATS = {"csv": ("text/csv", "csv"), "ndjson": ("application/x-ndjson", "ndjson"), "fhir": ("application/fhir+json", "json")}
+CHUNK_SIZE = 5000
+SPOOL_PREFIX = "asclepius_export_"
+SPOOL_MAX_AGE = 3600   # seconds an unclaimed spooled export may stay on disk
+UI_EXPORT_MAX_BYTES = int(float(os.environ.get("ASCLEPIUS_UI_EXPORT_MB", 50)) * 1024 * 1024)
+
+# Vital -> (LOINC code, display, unit)
+VITAL_CODES = {
+    "BP": ("85354-9", "Blood pressure panel", None),
+    "Pulse": ("8867-4", "Heart rate", "/min"),
+    "Weight": ("29463-7", "Body weight", "kg"),
+    "Temp": ("8310-5", "Body temperature", "[degF]"),
+}
+TEXT_COLUMNS = ["Patient Name", "Diagnosis", "Full_Prescription", "Doctors_Notes"]
+
+
+# 1. PIPELINE STAGES
+def read_chunks(chunksize=CHUNK_SIZE):
+    if not os.path.exists(scribe_core.DB_FILE):
+        return
+    for chunk in pd.read_csv(scribe_core.DB_FILE, chunksize=chunksize, dtype=str, keep_default_na=False):
+        yield chunk
+
+def filter_dates(chunks, start=None, end=None):
+    # Dates are stored as YYYY-MM-DD, so string comparison is chronological
+    for chunk in chunks:
+        if start: chunk = chunk[chunk["Date"] >= start]
+        if end: chunk = chunk[chunk["Date"] <= end]
+        if not chunk.empty:
+            yield chunk
+
+def clean_chunks(chunks):
+    for chunk in chunks:
+        chunk = chunk.copy()
+        for col in COLUMNS:
+            if col not in chunk.columns: chunk[col] = "--"
+        for col in TEXT_COLUMNS:
+            chunk[col] = chunk[col].astype(str).apply(clean_text_forcefully)
+        yield chunk
+
+def iter_records(start=None, end=None, chunksize=CHUNK_SIZE):
+    for chunk in clean_chunks(filter_dates(read_chunks(chunksize), start, end)):
+        extra = [c for c in chunk.columns if c not in COLUMNS]
+        for row in chunk[COLUMNS + extra].itertuples(index=False, name=None):
+            yield dict(zip(COLUMNS + extra, (clean_nan(v or None) for v in row)))
+
+
+# 2. SERIALISERS
+def to_csv(records):
+    buf = io.StringIO()
+    writer = None
+    for rec in records:
+        if writer is None:
+            writer = csv.DictWriter(buf, fieldnames=list(rec.keys()), extrasaction="ignore")
+            writer.writeheader()
+        writer.writerow(rec)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if writer is None:
+        yield ",".join(COLUMNS) + "\r\n"
+
+def to_ndjson(records):
+    for rec in records:
+        yield json.dumps(rec) + "\n"
+
+def visit_key(rec):
+    return "/".join(str(rec.get(col, "--")) for col in ("Date", "Time", "Doctor", "Patient Name", "Recording"))
+
+def _visit_resources(rec, occurrence=0, seen_patients=None):
+    """FHIR resources for one visit; `occurrence` tells identical visits apart."""
+    key = visit_key(rec) + (f"/{occurrence}" if occurrence else "")
+    visit_id = uuid.uuid5(uuid.NAMESPACE_URL, f"asclepius/visit/{key}")
+    encounter_ref = f"urn:uuid:{visit_id}"
+    when = f"{rec['Date']}T{rec['Time']}:00" if rec["Time"] != "--" else rec["Date"]
+
+    pid = rec.get("Patient ID", "--")
+    if pid != "--":
+        # One Patient per Patient ID, so the receiving EMR merges repeat visits
+        patient_ref = f"urn:uuid:{uuid.uuid5(uuid.NAMESPACE_URL, f'asclepius/patient/{pid}')}"
+    else:
+        patient_ref = f"urn:uuid:{uuid.uuid5(visit_id, 'patient')}"
+    if seen_patients is None or patient_ref not in seen_patients:
+        if seen_patients is not None: seen_patients.add(patient_ref)
+        patient = {"resourceType": "Patient", "name": [{"text": rec["Patient Name"]}]}
+        if pid != "--":
+            patient["identifier"] = [{"system": "urn:asclepius:patient-id", "value": pid}]
+        yield patient_ref, patient
+    encounter = {
+        "resourceType": "Encounter", "status": "finished",
+        "class": {"system": "http://terminology.hl7.org/CodeSystem/v3-ActCode", "code": "AMB"},
+        "subject": {"reference": patient_ref},
+        "participant": [{"individual": {"display": rec["Doctor"]}}],
+        "period": {"start": when},
+    }
+    if rec["Age"] != "--":
+        # Age is per visit, so it lives on the Encounter rather than the shared Patient
+        encounter["extension"] = [{"url": "urn:asclepius:age-at-visit", "valueString": rec["Age"]}]
+    if rec["Diagnosis"] not in ("--", "See Rx"):
+        encounter["reasonCode"] = [{"text": rec["Diagnosis"]}]
+    yield encounter_ref, encounter
+
+    for col, (code, display, unit) in VITAL_CODES.items():
+        if rec[col] == "--": continue
+        obs = {
+            "resourceType": "Observation", "status": "final",
+            "code": {"coding": [{"system": "http://loinc.org", "code": code, "display": display}]},
+            "subject": {"reference": patient_ref}, "encounter": {"reference": encounter_ref},
+            "effectiveDateTime": when, "valueString": rec[col],
+        }
+        if unit: obs["extension"] = [{"url": "urn:asclepius:unit", "valueString": unit}]
+        yield f"urn:uuid:{uuid.uuid5(visit_id, col)}", obs
+
+    if rec["Full_Prescription"] != "--":
+        rx = {
+            "resourceType": "MedicationRequest", "status": "active", "intent": "order",
+            "subject": {"reference": patient_ref}, "encounter": {"reference": encounter_ref},
+            "authoredOn": when, "requester": {"display": rec["Doctor"]},
+            "medicationCodeableConcept": {"text": rec["Full_Prescription"]},
+        }
+        # FHIR forbids empty arrays: leave "note" out when there is none
+        if rec["Doctors_Notes"] != "--": rx["note"] = [{"text": rec["Doctors_Notes"]}]
+        yield f"urn:uuid:{uuid.uuid5(visit_id, 'rx')}", rx
+
+def to_fhir(records):
+    # One Bundle document, written entry by entry so it is never held in memory
+    yield '{"resourceType": "Bundle", "type": "collection", "entry": ['
+    first = True
+    seen_patients, occurrences = set(), Counter()
+    for rec in records:
+        key = visit_key(rec)
+        for full_url, resource in _visit_resources(rec, occurrences[key], seen_patients):
+            yield ("" if first else ",") + "\n" + json.dumps({"fullUrl": full_url, "resource": resource})
+            first = False
+        occurrences[key] += 1
+    yield "\n]}\n"
+
+SERIALISERS = {"csv": to_csv, "ndjson": to_ndjson, "fhir": to_fhir}
+
+
+# 3. ENTRY POINTS
+def export_stream(fmt, start=None, end=None, chunksize=CHUNK_SIZE):
+    if fmt not in SERIALISERS:
+        raise ValueError(f"Unknown export format '{fmt}' (choose from {', '.join(SERIALISERS)})")
+    return SERIALISERS[fmt](iter_records(start, end, chunksize))
+
+def write_export(fh, fmt, start=None, end=None, chunksize=CHUNK_SIZE):
+    for piece in export_stream(fmt, start, end, chunksize):
+        fh.write(piece)
+
+def sweep_spooled(max_age=SPOOL_MAX_AGE):
+    """Delete spooled exports older than max_age seconds (abandoned sessions); returns the count."""
+    tmpdir, cutoff, removed = tempfile.gettempdir(), time.time() - max_age, 0
+    for name in os.listdir(tmpdir):
+        if not name.startswith(SPOOL_PREFIX): continue
+        try:
+            path = os.path.join(tmpdir, name)
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue  # another worker got there first, or not ours to delete
+    return removed
+
+def spool_export(fmt, start=None, end=None, chunksize=CHUNK_SIZE, max_bytes=None):
+    # Streamlit needs a file to hand out; spool to disk rather than building a string.
+    # The file holds PHI: callers delete it once served, and stragglers are swept here.
+    sweep_spooled()
+    ext = FORMATS[fmt][1] if fmt in FORMATS else "txt"
+    with tempfile.NamedTemporaryFile("w", suffix=f".{ext}", prefix=SPOOL_PREFIX, newline="", encoding="utf-8", delete=False) as fh:
+        try:
+            written = 0
+            for piece in export_stream(fmt, start, end, chunksize):
+                written += len(piece.encode("utf-8"))
+                if max_bytes is not None and written > max_bytes:
+                    raise ValueError(f"Export is larger than {max_bytes // 2**20} MB: narrow the date range or run python export.py")
+                fh.write(piece)
+        except BaseException:
+            fh.close()
+            os.remove(fh.name)
+            raise
+    return fh.name
+
+
+def iso_date(value):
+    # Dates are compared as strings, so "2024-1-5" is zero-padded before filtering
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a YYYY-MM-DD date: {value!r}") from None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export visits from the patient archive.")
+    parser.add_argument("--format", choices=sorted(SERIALISERS), default="csv")
+    parser.add_argument("--start", type=iso_date, help="First visit date to include (YYYY-MM-DD)")
+    parser.add_argument("--end", type=iso_date, help="Last visit date to include (YYYY-MM-DD)")
+    parser.add_argument("--out", default="-", help="Output file (default: stdout)")
+    parser.add_argument("--db", default=scribe_core.DB_FILE, help="Patient archive CSV")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE, help="Rows read from the archive at a time")
+    args = parser.parse_args(argv)
+    if args.start and args.end and args.start > args.end:
+        parser.error(f"--start {args.start} is after --end {args.end}")
+
+    scribe_core.DB_FILE = args.db
+    if args.out == "-":
+        write_export(sys.stdout, args.format, args.start, args.end, args.chunksize)
+    else:
+        with open(args.out, "w", newline="", encoding="utf-8") as fh:
+            write_export(fh, args.format, args.start, args.end, args.chunksize)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
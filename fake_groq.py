@@ -0,0 +1,123 @@
+"""Local stand-in for the Groq API, for exercising groq_governor without a real key.
+
+    python fake_groq.py --port 8765 --latency 0.4 --rate-limit-rate 0.2
+
+Point a client at it with ``Groq(api_key="fake", base_url="http://127.0.0.1:8765", max_retries=0)``
+(the SDK also honours ``GROQ_BASE_URL``).
+It answers the two endpoints the scribe uses with canned output, after a
+configurable delay, and fails a configurable share of requests with 429
+(carrying a Retry-After header) or 503.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_TRANSCRIPT = "Patient Ramesh Kumar, 45 years. BP 130/85, pulse 78. Fever for three days. Paracetamol 650 mg twice daily for 5 days."
+CANNED_EXTRACTION = """Name: Ramesh Kumar
+Age: 45
+BP: 130/85
+Pulse: 78
+Weight: --
+Temp: 101
+Diagnosis: Viral fever
+Rx: Paracetamol 650 mg, twice daily, 5 days
+Notes: Review if fever persists beyond 3 days"""
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().strip() or b"0", 16)
+                self.rfile.read(size + 2)
+                if size == 0: return
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _respond(self, cfg, stats):
+        time.sleep(max(0.0, random.gauss(cfg["latency"], cfg["jitter"])))
+        roll = random.random()
+        if roll < cfg["rate_limit_rate"]:
+            with self.server.lock: stats["429"] += 1
+            return 429, json.dumps({"error": {"message": "Rate limit reached", "type": "requests"}}), "application/json", {"Retry-After": str(cfg["retry_after"])}
+        if roll < cfg["rate_limit_rate"] + cfg["error_rate"]:
+            with self.server.lock: stats["5xx"] += 1
+            return 503, json.dumps({"error": {"message": "Service unavailable"}}), "application/json", None
+
+        if self.path.endswith("/audio/transcriptions"):
+            return 200, CANNED_TRANSCRIPT, "text/plain", None
+        if self.path.endswith("/chat/completions"):
+            return 200, json.dumps({
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                "model": "llama-3.3-70b-versatile",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": CANNED_EXTRACTION}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            }), "application/json", None
+        return 404, json.dumps({"error": {"message": f"unknown path {self.path}"}}), "application/json", None
+
+    def do_POST(self):
+        self._read_body()
+        stats = self.server.stats
+        with self.server.lock:
+            stats["requests"] += 1
+            stats["in_flight"] += 1
+            stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+        try:
+            status, body, content_type, headers = self._respond(self.server.config, stats)
+        finally:
+            # Finished before the client sees the reply, so peak_in_flight never over-counts
+            with self.server.lock: stats["in_flight"] -= 1
+        self._send(status, body, content_type, headers)
+
+
+def start_fake_groq(port=0, latency=0.3, jitter=0.1, rate_limit_rate=0.0, error_rate=0.0, retry_after=0):
+    """Start the server on a daemon thread; returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeGroqHandler)
+    server.daemon_threads = True
+    server.config = {"latency": latency, "jitter": jitter, "rate_limit_rate": rate_limit_rate,
+                     "error_rate": error_rate, "retry_after": retry_after}
+    server.stats = {"requests": 0, "in_flight": 0, "peak_in_flight": 0, "429": 0, "5xx": 0}
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a fake Groq API on localhost.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="Mean response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Std-dev of the response delay")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--retry-after", type=int, default=0, help="Retry-After seconds sent with 429s")
+    args = parser.parse_args(argv)
+
+    server, url = start_fake_groq(args.port, args.latency, args.jitter, args.rate_limit_rate, args.error_rate, args.retry_after)
+    print(f"Fake Groq listening on {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(5)
+            print(json.dumps(server.stats))
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Local stand-in SMTP relay for load tests and staging.
+
+    python fake_smtp.py --port 2525 --latency 0.2 --error-rate 0.05
+
+Point the app at it with ASCLEPIUS_SMTP_HOST=127.0.0.1 ASCLEPIUS_SMTP_PORT=2525
+ASCLEPIUS_SMTP_STARTTLS=off. It speaks just enough SMTP for smtplib
+(EHLO, AUTH PLAIN/LOGIN, MAIL, RCPT, DATA, QUIT), accepts any credentials,
+discards the message, waits a configurable delay before accepting it and
+rejects a configurable share of messages with a 451.
+"""
+import argparse
+import json
+import random
+import socketserver
+import threading
+import time
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode("ascii"))
+        self.wfile.flush()
+
+    def handle(self):
+        cfg, stats, lock = self.server.config, self.server.stats, self.server.lock
+        with lock: stats["connections"] += 1
+        self.reply("220 fake-smtp ready")
+        while True:
+            raw = self.rfile.readline()
+            if not raw: return
+            line = raw.decode("utf-8", "replace").rstrip("\r\n")
+            cmd = line.split(" ", 1)[0].upper()
+            if cmd == "EHLO":
+                self.reply("250-fake-smtp")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif cmd == "HELO":
+                self.reply("250 fake-smtp")
+            elif cmd == "AUTH":
+                if line.upper().startswith("AUTH LOGIN"):
+                    # Username and password prompts; the values are not checked
+                    if len(line.split()) < 3:
+                        self.reply("334 VXNlcm5hbWU6")
+                        self.rfile.readline()
+                    self.reply("334 UGFzc3dvcmQ6")
+                    self.rfile.readline()
+                self.reply("235 2.7.0 Authentication successful")
+            elif cmd in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self.reply("250 OK")
+            elif cmd == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b".\r\n", b".\n"): break
+                    size += len(chunk)
+                time.sleep(max(0.0, random.gauss(cfg["latency"], cfg["jitter"])))
+                if random.random() < cfg["error_rate"]:
+                    with lock: stats["rejected"] += 1
+                    self.reply("451 4.3.0 Temporary failure, try again later")
+                else:
+                    with lock:
+                        stats["accepted"] += 1
+                        stats["bytes"] += size
+                    self.reply("250 OK queued")
+            elif cmd == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_fake_smtp(port=0, latency=0.2, jitter=0.05, error_rate=0.0):
+    """Start the server on a daemon thread; returns (server, host, port)."""
+    server = _Server(("127.0.0.1", port), FakeSMTPHandler)
+    server.config = {"latency": latency, "jitter": jitter, "error_rate": error_rate}
+    server.stats = {"connections": 0, "accepted": 0, "rejected": 0, "bytes": 0}
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "127.0.0.1", server.server_address[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a fake SMTP relay on localhost.")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean delay before a message is accepted")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Std-dev of that delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of messages rejected with 451")
+    args = parser.parse_args(argv)
+
+    server, host, port = start_fake_smtp(args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Fake SMTP listening on {host}:{port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(5)
+            print(json.dumps(server.stats))
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
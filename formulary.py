@@ -0,0 +1,293 @@
+"""Local drug formulary for Rx normalisation and autocomplete.
+
+The formulary (formulary.csv, or ASCLEPIUS_FORMULARY) is loaded once per
+process into a prefix trie stored as flat per-node arrays rather than one
+object per node. The trie answers:
+
+* complete("amlo")        -> drugs starting with the prefix, alphabetically
+* fuzzy("paracetmol", 2)  -> drugs within an edit distance, by walking the trie
+                             with one Levenshtein row per node and pruning any
+                             branch whose row minimum already exceeds the limit
+                             (the first letter must match)
+
+normalize_rx() uses it on extracted Rx lines: exact brand names and aliases
+become the generic ("Dolo" -> "Paracetamol"), strengths and frequencies are
+tidied ("650mg" -> "650 mg", "BD" -> "twice daily") and strengths the
+formulary does not list are flagged. A name that only fuzzy-matches is never
+rewritten (Prednisone is not Prednisolone): it is left as dictated and the
+nearest formulary drug is offered as a warning.
+
+    python bench_formulary.py     # latency on a 50k-entry formulary
+"""
+import csv
+import os
+import re
+import threading
+
+FORMULARY_FILE = os.environ.get("ASCLEPIUS_FORMULARY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "formulary.csv"))
+
+# Words that are never drug names, so they are never fuzzy-matched against one
+STOPWORDS = {
+    "tab", "tablet", "tablets", "cap", "capsule", "capsules", "syp", "syrup", "inj", "injection", "oint", "ointment",
+    "cream", "drops", "gel", "sachet", "inhaler", "puff", "puffs", "rx", "take", "apply", "after", "before", "with",
+    "food", "meal", "meals", "morning", "night", "evening", "daily", "days", "day", "week", "weeks", "month", "for",
+    "and", "then", "once", "twice", "thrice", "times", "each", "every", "hours", "hour", "as", "needed", "at",
+    "bedtime", "empty", "stomach", "continue", "stop", "if", "fever", "pain", "required", "dose", "the", "of", "to",
+}
+
+UNIT_CANON = {"mg": "mg", "mcg": "mcg", "ug": "mcg", "µg": "mcg", "g": "g", "gm": "g", "gms": "g", "ml": "ml",
+              "iu": "IU", "unit": "units", "units": "units"}
+STRENGTH_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(mg|mcg|ug|µg|gms?|g|ml|iu|units?)\b", re.IGNORECASE)
+
+FREQUENCIES = [
+    (r"\b(?:od|qd|once a day|once daily)\b", "once daily"),
+    (r"\b(?:bd|bid|twice a day|twice daily)\b", "twice daily"),
+    (r"\b(?:tds|tid|thrice daily|three times a day)\b", "three times daily"),
+    (r"\b(?:qid|four times a day)\b", "four times daily"),
+    (r"\b(?:hs|at bedtime)\b", "at bedtime"),
+    (r"\b(?:sos|prn|as needed|when required)\b", "as needed"),
+    (r"\b1-0-0\b", "once daily (morning)"),
+    (r"\b0-0-1\b", "once daily (night)"),
+    (r"\b1-0-1\b", "twice daily"),
+    (r"\b1-1-1\b", "three times daily"),
+]
+FREQUENCIES = [(re.compile(p, re.IGNORECASE), canon) for p, canon in FREQUENCIES]
+
+
+def normalize_key(text):
+    return re.sub(r"[^a-z0-9 ]+", "", str(text).lower()).strip()
+
+def max_distance(word):
+    # Short words have too many close neighbours to correct safely
+    n = len(word)
+    return 0 if n <= 4 else 1 if n <= 8 else 2
+
+
+# 1. TRIE
+class FormularyTrie:
+    """Prefix trie in flat arrays: no per-node objects for the GC to walk.
+
+    Edges live in one int-keyed dict (node * FANOUT + ord(char) -> child) and
+    each node's outgoing characters in one string, so 50k drugs cost a few
+    containers instead of hundreds of thousands of small dicts.
+    """
+    __slots__ = ("_child", "_kids", "_entry", "entries")
+    FANOUT = 128   # keys are normalised to ASCII
+
+    def __init__(self):
+        self._child = {}       # node * FANOUT + ord(ch) -> child node
+        self._kids = [""]      # node -> its outgoing characters, sorted
+        self._entry = [-1]     # node -> entry index ending here, or -1
+        self.entries = []      # index -> (name, strengths tuple, form)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def node_count(self):
+        return len(self._kids)
+
+    def add(self, name, aliases=(), strengths=(), form=""):
+        idx = len(self.entries)
+        self.entries.append((name, tuple(strengths), form))
+        for key in (name, *aliases):
+            self._insert(normalize_key(key), idx)
+        return idx
+
+    def _insert(self, key, idx):
+        if not key: return
+        node = 0
+        for ch in key:
+            edge = node * self.FANOUT + ord(ch)
+            nxt = self._child.get(edge)
+            if nxt is None:
+                nxt = len(self._kids)
+                self._child[edge] = nxt
+                self._kids[node] = "".join(sorted(self._kids[node] + ch))
+                self._kids.append("")
+                self._entry.append(-1)
+            node = nxt
+        # First writer wins, so an alias never steals a generic name's key
+        if self._entry[node] < 0: self._entry[node] = idx
+
+    def _walk(self, key):
+        node = 0
+        for ch in key:
+            node = self._child.get(node * self.FANOUT + ord(ch))
+            if node is None: return None
+        return node
+
+    def exact(self, text):
+        node = self._walk(normalize_key(text))
+        if node is None or self._entry[node] < 0: return None
+        return self._entry[node]
+
+    def complete(self, prefix, limit=10):
+        node = self._walk(normalize_key(prefix))
+        if node is None: return []
+        found, seen = [], set()
+        stack = [node]
+        child, kids, fanout = self._child, self._kids, self.FANOUT
+        # Pre-order DFS: the prefix itself first, then alphabetical; stops after `limit` hits
+        while stack and len(found) < limit:
+            n = stack.pop()
+            idx = self._entry[n]
+            if idx >= 0 and idx not in seen:
+                seen.add(idx)
+                found.append(idx)
+            base = n * fanout
+            stack.extend(child[base + ord(ch)] for ch in reversed(kids[n]))
+        return found
+
+    def fuzzy(self, text, max_dist=None, prefix_len=1):
+        """Entries within max_dist edits of text, as sorted (distance, index) pairs.
+
+        Like most spelling correctors, the first `prefix_len` characters must
+        match exactly: misheard names rarely lose their first letter, and it
+        cuts the branches explored by roughly the alphabet size.
+        """
+        word = normalize_key(text)
+        if not word: return []
+        if max_dist is None: max_dist = max_distance(word)
+        start = self._walk(word[:prefix_len])
+        if start is None: return []
+        n = len(word)
+        # Row for the already-matched prefix: distance from word[:i] to word[:prefix_len]
+        row0 = [abs(i - prefix_len) for i in range(n + 1)]
+        best = {}
+        if self._entry[start] >= 0 and row0[n] <= max_dist:
+            best[self._entry[start]] = row0[n]
+        child, kids, entry, fanout = self._child, self._kids, self._entry, self.FANOUT
+        over = max_dist + 1
+        # Only cells within max_dist of the diagonal can stay under the limit (Ukkonen's band)
+        stack = [(start, prefix_len, [c if c <= max_dist else over for c in row0])]
+        while stack:
+            parent, depth, prev = stack.pop()
+            depth += 1
+            lo, hi = max(1, depth - max_dist), min(n, depth + max_dist)
+            base = parent * fanout
+            for ch in kids[parent]:
+                node = child[base + ord(ch)]
+                row = [over] * (n + 1)
+                row[0] = depth if depth <= max_dist else over
+                best_in_row = row[0]
+                left = row[lo - 1]
+                for i in range(lo, hi + 1):
+                    cost = prev[i - 1] if word[i - 1] == ch else prev[i - 1] + 1
+                    up = prev[i] + 1
+                    left += 1
+                    if up < left: left = up
+                    if cost < left: left = cost
+                    if left > over: left = over
+                    row[i] = left
+                    if left < best_in_row: best_in_row = left
+                idx = entry[node]
+                if idx >= 0 and row[n] <= max_dist and row[n] < best.get(idx, over):
+                    best[idx] = row[n]
+                if best_in_row <= max_dist:
+                    stack.append((node, depth, row))
+        return sorted(((d, i) for i, d in best.items()), key=lambda x: (x[0], len(self.entries[x[1]][0])))
+
+    def lookup(self, text):
+        """Best single entry for text: exact key first, then nearest fuzzy match."""
+        idx = self.exact(text)
+        if idx is not None: return idx, 0
+        matches = self.fuzzy(text)
+        if not matches: return None, None
+        # Two equally close drugs: refuse to guess
+        if len(matches) > 1 and matches[0][0] == matches[1][0]: return None, None
+        return matches[0][1], matches[0][0]
+
+
+# 2. LOADING (once per process)
+_trie = None
+_lock = threading.Lock()
+
+def load_formulary(path):
+    trie = FormularyTrie()
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            split = lambda v: [x.strip() for x in (v or "").split("|") if x.strip()]
+            trie.add(row["name"].strip(), split(row.get("aliases")), split(row.get("strengths")), (row.get("form") or "").strip())
+    return trie
+
+def get_formulary():
+    global _trie
+    with _lock:
+        if _trie is None:
+            _trie = load_formulary(FORMULARY_FILE) if os.path.exists(FORMULARY_FILE) else FormularyTrie()
+        return _trie
+
+def suggest(prefix, limit=10):
+    trie = get_formulary()
+    hits = trie.complete(prefix, limit)
+    if not hits and len(normalize_key(prefix)) >= 4:
+        hits = [i for _, i in trie.fuzzy(prefix)[:limit]]
+    return [trie.entries[i] for i in hits]
+
+
+# 3. RX NORMALISATION
+def normalize_strengths(line):
+    return STRENGTH_RE.sub(lambda m: f"{m.group(1)} {UNIT_CANON[m.group(2).lower()]}", line)
+
+def normalize_frequencies(line):
+    for pattern, canon in FREQUENCIES:
+        line = pattern.sub(canon, line)
+    return line
+
+def _match_drug(trie, words, start):
+    """Formulary entry named at words[start:], as (index, span, exact)."""
+    # Longest span first, so "Amoxicillin Clavulanate" beats "Amoxicillin"
+    for span in (3, 2, 1):
+        if start + span > len(words): continue
+        keys = [normalize_key(w) for w in words[start:start + span]]
+        if not all(keys) or any(k in STOPWORDS or k.replace(".", "").isdigit() for k in keys): continue
+        text = " ".join(keys)
+        idx = trie.exact(text)
+        if idx is not None: return idx, span, True
+        if len(text) >= 5:
+            idx, _ = trie.lookup(text)
+            if idx is not None: return idx, span, False
+    return None, 0, False
+
+def normalize_rx_line(line, trie=None):
+    trie = trie or get_formulary()
+    warnings = []
+    line = normalize_frequencies(normalize_strengths(line))
+    words = line.split(" ")
+    out, i, current = [], 0, None
+    while i < len(words):
+        idx, span, exact = _match_drug(trie, words, i)
+        if idx is None:
+            out.append(words[i])
+            i += 1
+            continue
+        name = trie.entries[idx][0]
+        if not exact:
+            # Could be a real drug we don't list: keep the dictated word, suggest only
+            heard = re.sub(r"[^A-Za-z0-9]+$", "", " ".join(words[i:i + span]))
+            warnings.append(f"{heard}: not in the formulary. Did you mean {name}?")
+            out.extend(words[i:i + span])
+            i += span
+            continue
+        # Keep trailing punctuation ("Dolo," -> "Paracetamol,")
+        tail = re.search(r"[^A-Za-z0-9]*$", words[i + span - 1]).group()
+        out.append(name + tail)
+        current = idx
+        i += span
+        strength = STRENGTH_RE.match(" ".join(words[i:i + 2]))
+        listed = trie.entries[current][1]
+        if strength and listed:
+            value = f"{strength.group(1)} {UNIT_CANON[strength.group(2).lower()]}"
+            if not any(s.lower().startswith(value.lower()) for s in listed):
+                warnings.append(f"{name}: {value} is not a listed strength ({', '.join(listed)})")
+    return " ".join(out), warnings
+
+def normalize_rx(text):
+    """Normalise every line of an Rx block; returns (text, warnings)."""
+    trie = get_formulary()
+    lines, warnings = [], []
+    for line in str(text or "").split("\n"):
+        fixed, warn = normalize_rx_line(line, trie)
+        lines.append(fixed)
+        warnings.extend(warn)
+    return "\n".join(lines), warnings
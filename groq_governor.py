@@ -0,0 +1,208 @@
+"""Process-wide governor for outbound Groq calls.
+
+Every Streamlit session (and every batch worker) runs in the same Python
+process, so one Governor instance sees all of them. It enforces:
+
+* a token bucket (sustained requests/second plus a burst allowance),
+* a cap on requests in flight,
+* round-robin fairness between doctors, so one busy session cannot starve others,
+* jittered exponential backoff on 429, 5xx and connection errors.
+
+Wrap a raw client with ``governed(client, doctor)``; the wrapper exposes the
+same ``audio.transcriptions.create`` / ``chat.completions.create`` calls.
+Build the raw client with ``max_retries=0`` so the SDK does not retry
+underneath us.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def _status_of(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None and getattr(exc, "response", None) is not None:
+        status = getattr(exc.response, "status_code", None)
+    return status
+
+def _is_retryable(exc):
+    status = _status_of(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # groq.APIConnectionError / APITimeoutError carry no status code
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+def _retry_after(exc):
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class Governor:
+    def __init__(self, rate=5.0, burst=10, max_in_flight=8, max_retries=4, base_delay=0.5, max_delay=20.0):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._cond = threading.Condition()
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._in_flight = 0
+        self._queues = {}       # tenant -> deque of waiting tickets
+        self._turns = deque()   # tenants with waiters, in round-robin order
+
+        self._stats = {"granted": 0, "retries": 0, "throttled": 0, "server_errors": 0, "failed": 0,
+                       "max_queue_depth": 0, "total_wait_s": 0.0}
+
+    # --- token bucket ---
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _queue_depth(self):
+        return sum(len(q) for q in self._queues.values())
+
+    # --- slots ---
+    def acquire(self, tenant):
+        ticket = object()
+        started = time.monotonic()
+        with self._cond:
+            if tenant not in self._queues:
+                self._queues[tenant] = deque()
+                self._turns.append(tenant)
+            self._queues[tenant].append(ticket)
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queue_depth())
+
+            try:
+                while True:
+                    self._refill(time.monotonic())
+                    my_turn = self._turns[0] == tenant and self._queues[tenant][0] is ticket
+                    if my_turn and self._in_flight < self.max_in_flight and self._tokens >= 1:
+                        break
+                    timeout = None
+                    if my_turn and self._in_flight < self.max_in_flight:
+                        timeout = (1 - self._tokens) / self.rate
+                    self._cond.wait(timeout)
+            except BaseException:
+                # Leave the queue cleanly so the doctors behind us are not wedged
+                self._queues[tenant].remove(ticket)
+                if not self._queues[tenant]:
+                    del self._queues[tenant]
+                    self._turns.remove(tenant)
+                self._cond.notify_all()
+                raise
+
+            self._tokens -= 1
+            self._in_flight += 1
+            self._queues[tenant].popleft()
+            self._turns.popleft()
+            if self._queues[tenant]:
+                self._turns.append(tenant)
+            else:
+                del self._queues[tenant]
+            self._stats["granted"] += 1
+            self._stats["total_wait_s"] += time.monotonic() - started
+            self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    # --- calls ---
+    def backoff(self, attempt, exc=None):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        hinted = _retry_after(exc) if exc is not None else None
+        # Honour the server's hint, but never park a session thread past max_delay
+        return max(delay, min(hinted, self.max_delay)) if hinted is not None else delay
+
+    def call(self, tenant, fn, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.acquire(tenant)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                status = _status_of(e)
+                with self._cond:
+                    if status == 429: self._stats["throttled"] += 1
+                    elif status is not None and status >= 500: self._stats["server_errors"] += 1
+                    if attempt >= self.max_retries or not _is_retryable(e):
+                        self._stats["failed"] += 1
+                        raise
+                    self._stats["retries"] += 1
+                delay = self.backoff(attempt, e)
+            finally:
+                self.release()
+            # Sleep without holding a slot so other doctors keep moving
+            time.sleep(delay)
+            attempt += 1
+
+    def snapshot(self):
+        with self._cond:
+            self._refill(time.monotonic())
+            stats = dict(self._stats)
+            stats.update({
+                "in_flight": self._in_flight,
+                "queued": self._queue_depth(),
+                "queued_by_doctor": {t: len(q) for t, q in self._queues.items()},
+                "tokens": round(self._tokens, 2),
+                "avg_wait_s": round(stats["total_wait_s"] / stats["granted"], 3) if stats["granted"] else 0.0,
+            })
+            return stats
+
+
+# --- client wrapper ---
+class _Endpoint:
+    def __init__(self, governor, tenant, create, rewind_file=False):
+        self._governor = governor
+        self._tenant = tenant
+        self._create = create
+        self._rewind_file = rewind_file
+
+    def create(self, **kwargs):
+        if self._rewind_file and isinstance(kwargs.get("file"), tuple):
+            # A retry must resend the whole recording, not a half-read stream
+            name, audio = kwargs["file"][0], kwargs["file"][1]
+            if hasattr(audio, "read"):
+                if hasattr(audio, "seek"): audio.seek(0)
+                kwargs["file"] = (name, audio.read()) + tuple(kwargs["file"][2:])
+        return self._governor.call(self._tenant, self._create, **kwargs)
+
+
+class GovernedClient:
+    def __init__(self, client, tenant, governor=None):
+        governor = governor or get_governor()
+        self.raw = client
+        self.audio = SimpleNamespace(transcriptions=_Endpoint(governor, tenant, client.audio.transcriptions.create, rewind_file=True))
+        self.chat = SimpleNamespace(completions=_Endpoint(governor, tenant, client.chat.completions.create))
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+def get_governor():
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = Governor(
+                rate=float(os.environ.get("GROQ_RATE_PER_SEC", 5)),
+                burst=int(os.environ.get("GROQ_BURST", 10)),
+                max_in_flight=int(os.environ.get("GROQ_MAX_IN_FLIGHT", 8)),
+                max_retries=int(os.environ.get("GROQ_MAX_RETRIES", 4)),
+            )
+        return _governor
+
+def governed(client, tenant):
+    if isinstance(client, GovernedClient): return client
+    return GovernedClient(client, tenant or "anonymous")
@@ -0,0 +1,212 @@
+"""End-to-end load test: how many concurrent doctors can one v2.py process carry?
+
+    python loadtest.py --sessions 40 --iterations 5
+    python loadtest.py --sessions 80 --duration 120 --groq-error-rate 0.1 --json report.json
+
+Each simulated session calls the same functions v2.py calls for a doctor
+(scribe_core, the Groq governor, the shared cache, the patient index and
+the formulary), as threads in one process like Streamlit's own sessions:
+
+    analyze  transcription + extraction against the local fake Groq server
+    approve  render the prescription PDF and archive the visit (CSV store)
+    archive  load the archive and render each row's PDF, as the Archive page does
+    email    send the PDF through the local fake SMTP relay
+
+Results cover scribe_core and the services behind it only: no Streamlit
+script runs and no page is rendered, so widget, rerun and websocket costs
+are not in these numbers.
+
+Both stand-in servers take configurable latency and error rates. Everything
+writes into a throwaway directory, never the real patient_records.csv.
+The report gives throughput, tail latency and errors per stage.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+import scribe_core
+import shared_cache
+from fake_groq import start_fake_groq
+from fake_smtp import start_fake_smtp
+from groq_governor import Governor, GovernedClient
+
+STAGES = ["analyze", "approve", "archive", "email"]
+
+
+# 1. MEASUREMENT
+class StageStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)
+        self.samples = {}
+
+    def run(self, stage, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            with self._lock:
+                self.errors[stage][type(e).__name__] += 1
+                self.samples.setdefault((stage, type(e).__name__), str(e)[:200])
+            return None, False
+        elapsed = time.perf_counter() - t0
+        with self._lock:
+            self.latencies[stage].append(elapsed)
+        return result, True
+
+    def summary(self, wall):
+        out = {}
+        for stage in STAGES:
+            lat = sorted(self.latencies.get(stage, []))
+            errs = self.errors.get(stage, Counter())
+            pct = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000, 1) if lat else None
+            out[stage] = {
+                "ok": len(lat), "errors": sum(errs.values()), "error_types": dict(errs),
+                "throughput_per_s": round(len(lat) / wall, 2) if wall else 0.0,
+                "p50_ms": pct(0.5), "p95_ms": pct(0.95), "p99_ms": pct(0.99),
+                "max_ms": round(lat[-1] * 1000, 1) if lat else None,
+            }
+        return out
+
+
+# 2. ONE SIMULATED DOCTOR
+def fake_recording(rng, size=16_000):
+    # Unique bytes per visit so the extraction cache cannot short-circuit the Groq call
+    header = b"RIFF" + (size + 36).to_bytes(4, "little") + b"WAVEfmt "
+    return header + rng.randbytes(size)
+
+def approve(doctor, fields):
+    vitals = {"BP": fields["bp"] or "--", "Pulse": fields["pulse"] or "--", "Weight": fields["weight"] or "--", "Temp": fields["temp"] or "--"}
+    pdf_bytes = scribe_core.create_pdf(doctor, fields["name"], fields["age"], fields["rx"], fields["notes"], vitals)
+    scribe_core.save_data(doctor, scribe_core.clean_text_forcefully(fields["name"]), fields["age"], "See Rx", fields["rx"], fields["notes"],
+                          vitals["BP"], vitals["Pulse"], vitals["Weight"], vitals["Temp"])
+    return pdf_bytes
+
+def browse_archive(max_rows):
+    df = scribe_core.load_data()
+    rows = df if not max_rows else df.head(max_rows)
+    for _, row in rows.iterrows():
+        vitals = {"BP": row.get("BP"), "Pulse": row.get("Pulse"), "Weight": row.get("Weight"), "Temp": row.get("Temp")}
+        scribe_core.create_pdf(row["Doctor"], row["Patient Name"], row["Age"], row["Full_Prescription"], row.get("Doctors_Notes"), vitals)
+    return len(rows)
+
+def email(pdf_bytes, patient):
+    ok, msg = scribe_core.send_email("clinic@example.test", "app-password", "patient@example.test", pdf_bytes, patient)
+    if not ok: raise RuntimeError(msg)
+
+def simulated_session(no, args, raw_client, governor, stats, deadline):
+    rng = random.Random(args.seed + no)
+    doctor = f"Dr. Load {no:03d}"
+    time.sleep(rng.uniform(0, args.ramp))
+    think = lambda: time.sleep(rng.uniform(0, 2 * args.think)) if args.think else None
+
+    client = GovernedClient(raw_client, doctor, governor)
+    done = 0
+    while (args.duration and time.monotonic() < deadline) or (not args.duration and done < args.iterations):
+        think()
+        fields, ok = stats.run("analyze", scribe_core.analyze_audio, client, fake_recording(rng), "visit.wav")
+        if not ok:
+            done += 1
+            continue
+        think()
+        pdf_bytes, ok = stats.run("approve", approve, doctor, fields)
+        think()
+        stats.run("archive", browse_archive, args.archive_rows)
+        if ok:
+            think()
+            stats.run("email", email, pdf_bytes, fields["name"] or "Patient")
+        done += 1
+
+
+# 3. DRIVER
+def print_report(summary, wall, extra):
+    print(f"\n{'stage':<9}{'ok':>7}{'err':>6}{'ops/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, s in summary.items():
+        fmt = lambda v: f"{v:>10.1f}" if v is not None else f"{'-':>10}"
+        print(f"{stage:<9}{s['ok']:>7}{s['errors']:>6}{s['throughput_per_s']:>9.2f}{fmt(s['p50_ms'])}{fmt(s['p95_ms'])}{fmt(s['p99_ms'])}{fmt(s['max_ms'])}")
+        for name, count in s["error_types"].items():
+            print(f"{'':<9}  {count} x {name}: {extra['error_samples'].get(f'{stage}/{name}', '')}")
+    print(f"\nwall time {wall:.1f}s | archive rows {extra['archive_rows']} | groq {extra['groq_server']} | smtp {extra['smtp_server']}")
+    print(f"governor {extra['governor']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the scribe against local fake Groq and SMTP servers.")
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent simulated doctors")
+    parser.add_argument("--iterations", type=int, default=3, help="Visits per doctor (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="Run for this many seconds instead of a fixed visit count")
+    parser.add_argument("--ramp", type=float, default=5.0, help="Spread session starts over this many seconds")
+    parser.add_argument("--think", type=float, default=0.5, help="Mean pause between a doctor's actions, in seconds")
+    parser.add_argument("--archive-rows", type=int, default=0, help="Rows rendered per archive visit (0 = all, like the app)")
+    parser.add_argument("--seed-records", type=int, default=0, help="Visits pre-loaded into the archive before the run")
+    parser.add_argument("--groq-latency", type=float, default=0.8)
+    parser.add_argument("--groq-rate-limit-rate", type=float, default=0.05)
+    parser.add_argument("--groq-error-rate", type=float, default=0.02)
+    parser.add_argument("--smtp-latency", type=float, default=0.3)
+    parser.add_argument("--smtp-error-rate", type=float, default=0.02)
+    parser.add_argument("--rate", type=float, default=float(os.environ.get("GROQ_RATE_PER_SEC", 5)), help="Governor requests/second")
+    parser.add_argument("--max-in-flight", type=int, default=int(os.environ.get("GROQ_MAX_IN_FLIGHT", 8)), help="Governor in-flight cap")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch archive and cache directory")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="asclepius_load_")
+    scribe_core.DB_FILE = os.path.join(workdir, "patient_records.csv")
+    shared_cache.CACHE_FILE = os.path.join(workdir, "shared_cache.sqlite3")
+
+    groq_server, groq_url = start_fake_groq(latency=args.groq_latency, jitter=args.groq_latency / 4,
+                                            rate_limit_rate=args.groq_rate_limit_rate, error_rate=args.groq_error_rate)
+    smtp_server, smtp_host, smtp_port = start_fake_smtp(latency=args.smtp_latency, jitter=args.smtp_latency / 4, error_rate=args.smtp_error_rate)
+    scribe_core.SMTP_HOST, scribe_core.SMTP_PORT, scribe_core.SMTP_STARTTLS = smtp_host, smtp_port, False
+
+    if args.seed_records:
+        scribe_core.save_records([
+            scribe_core.build_record(f"Dr. Seed {i % 7}", f"Seed Patient{i % 500}", str(20 + i % 60), "See Rx",
+                                     "Paracetamol 650 mg twice daily for 5 days", "--", "120/80", "72", "--", "--")
+            for i in range(args.seed_records)
+        ])
+
+    raw_client = scribe_core.make_client("fake-key", base_url=groq_url, max_retries=0)
+    governor = Governor(rate=args.rate, burst=max(1, int(args.rate * 2)), max_in_flight=args.max_in_flight)
+    stats = StageStats()
+
+    print(f"{args.sessions} sessions, {'%gs' % args.duration if args.duration else f'{args.iterations} visits each'}, scratch dir {workdir}")
+    started = time.monotonic()
+    threads = [threading.Thread(target=simulated_session, args=(i, args, raw_client, governor, stats, started + args.duration), daemon=True)
+               for i in range(args.sessions)]
+    for t in threads: t.start()
+    try:
+        for t in threads: t.join()
+    except KeyboardInterrupt:
+        print("Interrupted: reporting what finished so far.")
+    wall = time.monotonic() - started
+
+    summary = stats.summary(wall)
+    extra = {
+        "wall_s": round(wall, 1),
+        "archive_rows": len(scribe_core.load_data()),
+        "groq_server": dict(groq_server.stats), "smtp_server": dict(smtp_server.stats),
+        "governor": governor.snapshot(), "cache": shared_cache.stats(),
+        "error_samples": {f"{stage}/{name}": msg for (stage, name), msg in stats.samples.items()},
+    }
+    print_report(summary, wall, extra)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "stages": summary, **extra}, f, indent=2)
+
+    groq_server.shutdown()
+    smtp_server.shutdown()
+    if not args.keep: shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
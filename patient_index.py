@@ -0,0 +1,305 @@
+"""Patient identity index: links repeat visits whose free-text names differ.
+
+"Ramesh Kumar", "Ramesh kumar" and "R. Kumar" (same age) should be one
+patient; "Rajesh Kumar" must not be. Surnames may differ by a misheard
+letter, but first names must match exactly or as an initial: merging two
+patients' histories is worse than leaving a visit unlinked. Comparing every new visit against the whole archive is quadratic,
+so candidates are found through blocking keys instead:
+
+    (first initial, surname character trigram) -> birth-year band -> {patient ids}
+
+A lookup probes only the surname's trigrams in the neighbouring birth-year
+bands, then scores that short list on name similarity and age
+compatibility. The index is built from patient_records.csv once per
+process; after that only rows appended to the CSV are indexed.
+
+    python patient_index.py backfill      # write IDs into older records now
+    python bench_patient_index.py          # 1M-visit benchmark
+"""
+import io
+import os
+import re
+import sys
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+from difflib import SequenceMatcher
+
+TITLES = {"mr", "mrs", "ms", "miss", "dr", "shri", "sri", "smt", "kumari", "master", "baby", "patient"}
+ID_COLUMN = "Patient ID"
+UNKNOWN_BAND = None
+
+
+# 1. NORMALISATION
+def normalize_name(name):
+    if not isinstance(name, str): return ()
+    text = re.sub(r"[^a-z\s]", " ", name.lower())
+    return tuple(t for t in text.split() if t not in TITLES)
+
+def parse_age(age):
+    m = re.search(r"\d{1,3}", str(age or ""))
+    if not m: return None
+    value = int(m.group())
+    return value if 0 <= value <= 120 else None
+
+def ngrams(token, n=3):
+    padded = f"#{token}#"
+    return {padded[i:i + n] for i in range(max(1, len(padded) - n + 1))}
+
+def _visit_year(when):
+    if isinstance(when, datetime): return when.year
+    try:
+        return int(str(when)[:4])
+    except ValueError:
+        return datetime.now().year
+
+def _similar(a, b):
+    return 1.0 if a == b else SequenceMatcher(None, a, b).ratio()
+
+
+# 2. INDEX
+class PatientIndex:
+    def __init__(self, band_years=3, max_age_drift=2, surname_threshold=0.85):
+        self.band_years = band_years
+        self.max_age_drift = max_age_drift
+        self.surname_threshold = surname_threshold
+
+        self._patients = {}   # pid -> {"first", "surname", "birth_year", "visits"}
+        self._blocks = defaultdict(lambda: defaultdict(set))
+        self._next_id = 1
+        self.probes = 0       # candidates scored, for the benchmark
+
+    def __len__(self):
+        return len(self._patients)
+
+    def _band(self, birth_year):
+        return UNKNOWN_BAND if birth_year is None else birth_year // self.band_years
+
+    def _keys(self, first, surname):
+        initial = first[:1]
+        return [(initial, g) for g in ngrams(surname)]
+
+    def _add_to_blocks(self, pid, first, surname, birth_year):
+        band = self._band(birth_year)
+        for key in self._keys(first, surname):
+            self._blocks[key][band].add(pid)
+
+    def _move_band(self, pid, old_year, new_year):
+        p = self._patients[pid]
+        old, new = self._band(old_year), self._band(new_year)
+        if old == new: return
+        for key in self._keys(p["first"], p["surname"]):
+            self._blocks[key][old].discard(pid)
+            self._blocks[key][new].add(pid)
+
+    def _new_id(self):
+        while f"P{self._next_id:06d}" in self._patients:
+            self._next_id += 1
+        pid = f"P{self._next_id:06d}"
+        self._next_id += 1
+        return pid
+
+    # --- matching ---
+    def _candidates(self, first, surname, birth_year):
+        bands = None
+        if birth_year is not None:
+            b = self._band(birth_year)
+            bands = (b - 1, b, b + 1, UNKNOWN_BAND)
+        hits = Counter()
+        keys = self._keys(first, surname)
+        for key in keys:
+            by_band = self._blocks.get(key)
+            if not by_band: continue
+            for band in (bands if bands is not None else list(by_band)):
+                pids = by_band.get(band)
+                if pids: hits.update(pids)
+        # A real surname match shares most trigrams; one stray gram is noise
+        need = max(1, len(keys) // 2)
+        return [pid for pid, n in hits.items() if n >= need]
+
+    def _score(self, pid, first, surname, birth_year):
+        p = self._patients[pid]
+        s_sim = _similar(surname, p["surname"])
+        if s_sim < self.surname_threshold: return 0.0
+        a, b = first, p["first"]
+        # One letter apart is usually a different person (Ramesh/Rajesh, Anita/Amita)
+        if a == b: f_sim = 1.0
+        elif (len(a) == 1 or len(b) == 1) and a[:1] == b[:1]: f_sim = 0.7
+        else: return 0.0
+        if birth_year is not None and p["birth_year"] is not None:
+            if abs(birth_year - p["birth_year"]) > self.max_age_drift: return 0.0
+            age_bonus = 0.0
+        else:
+            age_bonus = -0.05
+        return (s_sim + f_sim) / 2 + age_bonus
+
+    def match(self, name, age=None, when=None):
+        tokens = normalize_name(name)
+        if len(tokens) < 2: return None
+        first, surname = tokens[0], tokens[-1]
+        age = parse_age(age)
+        birth_year = _visit_year(when) - age if age is not None else None
+
+        scored = []
+        for pid in self._candidates(first, surname, birth_year):
+            self.probes += 1
+            score = self._score(pid, first, surname, birth_year)
+            if score > 0: scored.append((score, pid))
+        if not scored: return None
+        scored.sort(reverse=True)
+        # Two equally good patients (e.g. "R. Kumar" vs Ramesh and Rajesh): don't guess
+        if len(scored) > 1 and scored[0][0] - scored[1][0] < 1e-9: return None
+        return scored[0][1]
+
+    # --- registration ---
+    def register(self, pid, name, age=None, when=None):
+        tokens = normalize_name(name)
+        first, surname = (tokens[0], tokens[-1]) if len(tokens) >= 2 else ("", tokens[0] if tokens else "")
+        age = parse_age(age)
+        birth_year = _visit_year(when) - age if age is not None else None
+
+        p = self._patients.get(pid)
+        if p is None:
+            self._patients[pid] = {"first": first, "surname": surname, "birth_year": birth_year, "visits": 1}
+            if surname: self._add_to_blocks(pid, first, surname, birth_year)
+            return pid
+        p["visits"] += 1
+        # Upgrade "R." to "Ramesh" once a fuller name turns up (initial, so blocks, unchanged)
+        if len(first) > len(p["first"]) and first[:1] == p["first"][:1]:
+            p["first"] = first
+        if p["birth_year"] is None and birth_year is not None:
+            self._move_band(pid, None, birth_year)
+            p["birth_year"] = birth_year
+        return pid
+
+    def assign(self, name, age=None, when=None):
+        pid = self.match(name, age, when) or self._new_id()
+        return self.register(pid, name, age, when)
+
+    def visits(self, pid):
+        p = self._patients.get(pid)
+        return p["visits"] if p else 0
+
+
+# 3. PROCESS-WIDE INDEX OVER THE ARCHIVE
+# save_records() rewrites the CSV with old rows first and new rows last, so
+# another process's save usually just appends. _synced remembers the file's
+# size and last bytes: if they are still in place, only the rows after them
+# are read and indexed; anything else (a delete, a hand edit) rebuilds.
+TAIL_BYTES = 4096
+_index = None
+_synced = None   # (size, bytes just before size) of the file _index covers
+_lock = threading.RLock()
+
+def _file_state(path):
+    try:
+        with open(path, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - TAIL_BYTES))
+            return size, f.read()
+    except OSError:
+        return None
+
+def _reserve_ids(idx, pids):
+    numbers = [int(p[1:]) for p in pids if isinstance(p, str) and re.fullmatch(r"P\d+", p)]
+    if numbers: idx._next_id = max(idx._next_id, max(numbers) + 1)
+
+def build_index(df):
+    """Index every visit in df, filling in Patient IDs for rows that lack one.
+
+    Returns (index, number of rows filled); df is updated in place.
+    """
+    idx = PatientIndex()
+    if df is None or df.empty: return idx, 0
+    if ID_COLUMN not in df.columns: df[ID_COLUMN] = "--"
+    # New IDs must never collide with IDs already written further down the file
+    _reserve_ids(idx, df[ID_COLUMN].unique())
+    filled = 0
+    ordered = df.sort_values(by=["Date", "Time"])
+    for row_id, name, age, date, pid in ordered[["Patient Name", "Age", "Date", ID_COLUMN]].itertuples(index=True, name=None):
+        if isinstance(pid, str) and pid.startswith("P"):
+            idx.register(pid, name, age, date)
+        else:
+            df.at[row_id, ID_COLUMN] = idx.assign(name, age, date)
+            filled += 1
+    return idx, filled
+
+def _index_appended(path, old_size):
+    """Register the rows written after old_size; False if they cannot be indexed alone."""
+    import pandas as pd
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(old_size)
+        appended = f.read()
+    rows = pd.read_csv(io.BytesIO(header + appended), dtype=str, keep_default_na=False)
+    if ID_COLUMN not in rows.columns or not rows[ID_COLUMN].str.startswith("P").all(): return False
+    _reserve_ids(_index, rows[ID_COLUMN].unique())
+    for name, age, date, pid in rows[["Patient Name", "Age", "Date", ID_COLUMN]].itertuples(index=False, name=None):
+        _index.register(pid, name, age, date)
+    return True
+
+def get_index(df=None):
+    """Index for the current archive, caught up with any rows appended since.
+
+    Runs under the archive lock: the first build over an archive written
+    before Patient IDs existed persists the IDs it assigns, so they stay
+    stable across rebuilds and processes.
+    """
+    global _index, _synced
+    import scribe_core
+    with scribe_core.records_lock(), _lock:
+        state = _file_state(scribe_core.DB_FILE)
+        if _index is not None and state == _synced: return _index
+        if _index is not None and state and _synced and state[0] > _synced[0]:
+            old_size, old_tail = _synced
+            with open(scribe_core.DB_FILE, "rb") as f:
+                f.seek(old_size - len(old_tail))
+                unchanged = f.read(len(old_tail)) == old_tail
+            if unchanged and _index_appended(scribe_core.DB_FILE, old_size):
+                _synced = state
+                return _index
+        if df is None: df = scribe_core.load_data()
+        _index, filled = build_index(df)
+        if filled:
+            scribe_core._write_data(df.sort_index())
+            state = _file_state(scribe_core.DB_FILE)
+        _synced = state
+        return _index
+
+def mark_synced():
+    # Called under the archive lock after save_records() wrote rows this index already knows about
+    global _synced
+    import scribe_core
+    with _lock:
+        _synced = _file_state(scribe_core.DB_FILE)
+
+def link_records(records, df=None):
+    import scribe_core
+    with scribe_core.records_lock(), _lock:
+        idx = get_index(df)
+        for rec in records:
+            if not str(rec.get(ID_COLUMN) or "").startswith("P"):
+                rec[ID_COLUMN] = idx.assign(rec.get("Patient Name"), rec.get("Age"), rec.get("Date"))
+    return records
+
+def find_patient(name, age=None):
+    idx = get_index()
+    with _lock:
+        return idx.match(name, age, datetime.now())
+
+def patient_visits(pid):
+    idx = get_index()
+    with _lock:
+        return idx.visits(pid)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        print("usage: python patient_index.py backfill")
+        sys.exit(2)
+    import scribe_core
+    with scribe_core.records_lock():
+        df = scribe_core.load_data()
+        _, filled = build_index(df)
+        if filled: scribe_core._write_data(df.sort_index())
+    print(f"Assigned Patient IDs to {filled} visit(s).")
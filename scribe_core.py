@@ -0,0 +1,328 @@
+"""Asclepius scribe core: transcription, extraction, storage and PDF rendering.
+
+Nothing in here imports Streamlit, so the same logic drives the interactive
+Consultation Chamber (v2.py) and the headless batch CLI (batch_scribe.py).
+"""
+from fpdf import FPDF
+import pandas as pd
+import os
+import re
+import smtplib
+import threading
+from contextlib import contextmanager
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.mime.base import MIMEBase
+from email import encoders
+import urllib.parse
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:   # Windows: only sessions inside one process are serialised
+    fcntl = None
+
+import formulary
+import patient_index
+import shared_cache
+
+# 1. STORAGE SETUP
+DB_FILE = "patient_records.csv"
+COLUMNS = ["Date", "Time", "Doctor", "Patient Name", "Age", "Diagnosis", "Full_Prescription", "Doctors_Notes", "BP", "Pulse", "Weight", "Temp", "Patient ID", "Recording"]
+
+# Outgoing mail (overridable so staging and load tests can point at a local relay)
+SMTP_HOST = os.environ.get("ASCLEPIUS_SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("ASCLEPIUS_SMTP_PORT", 587))
+SMTP_STARTTLS = os.environ.get("ASCLEPIUS_SMTP_STARTTLS", "on").lower() not in ("0", "off", "false", "no")
+
+# 2. MODELS & PROMPT
+TRANSCRIBE_MODEL = "whisper-large-v3"
+EXTRACT_MODEL = "llama-3.3-70b-versatile"
+
+# Bump when the parsed shape or rendered output changes, so workers stop reusing old cache entries
+ARCHIVE_CACHE_VERSION = "archive-2"
+PDF_CACHE_VERSION = "pdf-1"
+EXTRACT_CACHE_VERSION = "extract-1"
+
+SYSTEM_PROMPT = """
+You are a Medical Translator and Data Extraction Engine.
+STEP 1: TRANSLATE Hindi/Hinglish to ENGLISH.
+STEP 2: EXTRACT.
+CRITICAL RULES:
+1. DO NOT include introductory text.
+2. Output ONLY the keys and values.
+3. For Medications (Rx), capture Dosage, Frequency, and Duration.
+
+Format (Key: Value):
+Name: [Name in English]
+Age: [Age or '--']
+BP: [BP or '--']
+Pulse: [Pulse or '--']
+Weight: [Weight or '--']
+Temp: [Temp or '--']
+Diagnosis: [Diagnosis in English]
+Rx: [Medication List in English]
+Notes: [Clinical Remarks in English]
+"""
+
+# Extraction line prefix -> field; anything else is part of the Rx body
+FIELD_PREFIXES = [
+    ("Name:", "name"), ("Patient Name:", "name"), ("Age:", "age"),
+    ("BP:", "bp"), ("Pulse:", "pulse"), ("Weight:", "weight"),
+    ("Temp:", "temp"), ("Notes:", "notes"),
+]
+
+# 3. TEXT HELPERS
+def clean_text_forcefully(text):
+    if not isinstance(text, str): return str(text)
+    text = re.sub(r'Here is the.*?:', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'Sure, I can.*', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'Based on.*', '', text, flags=re.IGNORECASE)
+    clean = text.encode('ascii', 'ignore').decode('ascii').strip()
+    return clean
+
+def clean_nan(val):
+    if val is None or pd.isna(val) or str(val).lower() == 'nan': return "--"
+    return str(val)
+
+# 4. GROQ PIPELINE
+def make_client(api_key, **kwargs):
+    from groq import Groq
+    return Groq(api_key=api_key, **kwargs)
+
+def transcribe_audio(client, audio, filename="rec.wav"):
+    return client.audio.transcriptions.create(file=(filename, audio), model=TRANSCRIBE_MODEL, response_format="text")
+
+def extract_fields(client, transcription):
+    res = client.chat.completions.create(
+        model=EXTRACT_MODEL,
+        messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": transcription}],
+        temperature=0.0
+    )
+    return clean_text_forcefully(res.choices[0].message.content)
+
+def parse_extraction(raw_data):
+    fields = {"name": "", "age": "", "bp": "", "pulse": "", "weight": "", "temp": "", "notes": "", "rx": ""}
+    rx_lines = []
+    for line in raw_data.split('\n'):
+        line = line.strip()
+        if not line: continue
+        for prefix, key in FIELD_PREFIXES:
+            if line.startswith(prefix):
+                fields[key] = line.replace(prefix, "").strip()
+                break
+        else:
+            rx_lines.append(line)
+    fields["rx"] = "\n".join(rx_lines).strip()
+    return fields
+
+def _audio_bytes(audio):
+    if isinstance(audio, (bytes, bytearray)): return bytes(audio)
+    if hasattr(audio, "getvalue"): return audio.getvalue()
+    audio.seek(0)
+    return audio.read()
+
+def analyze_audio(client, audio, filename="rec.wav"):
+    # The same recording analysed twice (or by two workers) costs one Groq round trip
+    data = _audio_bytes(audio)
+    key = shared_cache.make_key(EXTRACT_CACHE_VERSION, shared_cache.bytes_digest(data), TRANSCRIBE_MODEL, EXTRACT_MODEL, SYSTEM_PROMPT)
+    def compute():
+        transcription = transcribe_audio(client, data, filename)
+        return parse_extraction(extract_fields(client, transcription))
+    fields = dict(shared_cache.get_or_compute("extraction", key, compute))
+    # Applied after the cache so formulary updates reach previously analysed audio
+    fields["rx"], fields["rx_warnings"] = formulary.normalize_rx(fields["rx"])
+    return fields
+
+# 5. PATIENT RECORDS
+def _parse_archive():
+    df = pd.read_csv(DB_FILE)
+    for col in COLUMNS:
+        if col not in df.columns: df[col] = "--"
+    for col in ["Patient Name", "Diagnosis", "Full_Prescription", "Doctors_Notes"]:
+        df[col] = df[col].astype(str).apply(clean_text_forcefully)
+    return df.sort_values(by=["Date", "Time"], ascending=[False, False])
+
+def load_data():
+    if not os.path.exists(DB_FILE):
+        return pd.DataFrame(columns=COLUMNS)
+    version = shared_cache.file_version(DB_FILE)
+    key = shared_cache.make_key(ARCHIVE_CACHE_VERSION, *version)
+    return shared_cache.get_or_compute("archive", key, _parse_archive, tag=version[0])
+
+def _write_data(df):
+    # Write-then-rename so an interrupted save never leaves a truncated archive
+    tmp = f"{DB_FILE}.tmp"
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, DB_FILE)
+
+def build_record(doctor, name, age, diagnosis, full_text, notes, bp, pulse, weight, temp, when=None):
+    when = when or datetime.now()
+    return {
+        "Date": when.strftime("%Y-%m-%d"), "Time": when.strftime("%H:%M"),
+        "Doctor": doctor, "Patient Name": name, "Age": age, "Diagnosis": diagnosis,
+        "Full_Prescription": full_text, "Doctors_Notes": notes,
+        "BP": bp, "Pulse": pulse, "Weight": weight, "Temp": temp
+    }
+
+# Sessions share one process, but batch_scribe.py and other workers write the
+# same CSV: serialise every read-modify-write of the archive across both
+_records_lock = threading.RLock()
+_lock_depth = 0
+_lock_file = None
+
+@contextmanager
+def records_lock():
+    """Hold the archive for a read-modify-write (re-entrant, thread- and process-wide)."""
+    global _lock_depth, _lock_file
+    with _records_lock:
+        if _lock_depth == 0 and fcntl is not None:
+            _lock_file = open(f"{DB_FILE}.lock", "a")
+            fcntl.flock(_lock_file, fcntl.LOCK_EX)
+        _lock_depth += 1
+        try:
+            yield
+        finally:
+            _lock_depth -= 1
+            if _lock_depth == 0 and _lock_file is not None:
+                fcntl.flock(_lock_file, fcntl.LOCK_UN)
+                _lock_file.close()
+                _lock_file = None
+
+def save_records(records):
+    """Append records to the archive; returns how many were written.
+
+    Records carrying a "Recording" key (batch imports) are skipped when that
+    recording is already archived, so replaying a batch never duplicates it.
+    """
+    if not records: return 0
+    with records_lock():
+        df = load_data()
+        archived = set(df["Recording"].astype(str)) - {"--", "", "nan"}
+        records = [r for r in records if str(r.get("Recording") or "--") not in archived]
+        if not records: return 0
+        patient_index.link_records(records, df)
+        # load_data() sorts for display; write in file order so this save only appends
+        df = pd.concat([df.sort_index(), pd.DataFrame(records, columns=COLUMNS)], ignore_index=True)
+        _write_data(df)
+        patient_index.mark_synced()
+        return len(records)
+
+def save_data(doctor, name, age, diagnosis, full_text, notes, bp, pulse, weight, temp):
+    save_records([build_record(doctor, name, age, diagnosis, full_text, notes, bp, pulse, weight, temp)])
+
+def delete_record(index):
+    with records_lock():
+        df = load_data()
+        row = df.loc[index]
+        _write_data(df.drop(index).sort_index())
+    # The deleted visit's PDFs (keyed by print date: any day still inside the
+    # TTL, or the visit date for batch PDFs) must not linger in the shared cache.
+    # Consultation Chamber PDFs are keyed on the unsaved draft (every edit of
+    # it), which the archived row cannot reproduce: those only age out after
+    # PHI_TTL_SECONDS.
+    vitals = {"BP": row.get("BP"), "Pulse": row.get("Pulse"), "Weight": row.get("Weight"), "Temp": row.get("Temp")}
+    days = [datetime.now() - timedelta(days=d) for d in range(int(shared_cache.PHI_TTL_SECONDS // 86400) + 2)]
+    try:
+        days.append(datetime.strptime(str(row["Date"]), "%Y-%m-%d"))
+    except ValueError:
+        pass
+    shared_cache.purge("pdf", [
+        _pdf_key(row["Doctor"], row["Patient Name"], row["Age"], row["Full_Prescription"], row.get("Doctors_Notes"), vitals, day)
+        for day in days
+    ])
+
+# 6. DOCUMENTS & SHARING
+def _pdf_key(doctor_name, name, age, text, notes, vitals, day):
+    # The PDF prints the render date, so it is part of the key. Inputs are
+    # rendered as text, so key on str() too: 40 and np.int64(40) are one PDF.
+    parts = [str(v) for v in (doctor_name, name, age, text, notes)]
+    return shared_cache.make_key(PDF_CACHE_VERSION, *parts, sorted((k, str(v)) for k, v in vitals.items()), day.strftime('%Y-%m-%d'))
+
+def create_pdf(doctor_name, name, age, text, notes, vitals, when=None):
+    # `when` is the visit time printed on the PDF (default: now)
+    when = when or datetime.now()
+    key = _pdf_key(doctor_name, name, age, text, notes, vitals, when)
+    return shared_cache.get_or_compute("pdf", key, lambda: _render_pdf(doctor_name, name, age, text, notes, vitals, when))
+
+def _render_pdf(doctor_name, name, age, text, notes, vitals, when):
+    s_doctor = clean_text_forcefully(doctor_name)
+    s_name = clean_text_forcefully(name)
+    s_age = clean_text_forcefully(age)
+    s_text = clean_text_forcefully(text)
+    s_notes = clean_text_forcefully(notes)
+
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Times", 'B', 24)
+    pdf.cell(0, 10, "ASCLEPIUS MEDICAL CENTER", ln=True, align='C')
+    pdf.set_font("Times", 'I', 12)
+    pdf.cell(0, 10, f"Physician: {s_doctor}", ln=True, align='C')
+    pdf.line(10, 30, 200, 30)
+    pdf.ln(15)
+
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(100, 10, f"Patient: {s_name}", ln=0)
+    pdf.cell(90, 10, f"Age: {s_age} | Date: {when.strftime('%Y-%m-%d')}", ln=1, align='R')
+    pdf.ln(5)
+
+    pdf.set_font("Arial", 'B', 10)
+    pdf.set_fill_color(240, 240, 240)
+    v_bp = clean_text_forcefully(vitals.get('BP', '--'))
+    v_pulse = clean_text_forcefully(vitals.get('Pulse', '--'))
+    v_weight = clean_text_forcefully(vitals.get('Weight', '--'))
+    v_temp = clean_text_forcefully(vitals.get('Temp', '--'))
+    pdf.cell(45, 8, f"BP: {v_bp}", 1, 0, 'C', 1)
+    pdf.cell(45, 8, f"Pulse: {v_pulse} bpm", 1, 0, 'C', 1)
+    pdf.cell(45, 8, f"Weight: {v_weight} kg", 1, 0, 'C', 1)
+    pdf.cell(45, 8, f"Temp: {v_temp} F", 1, 1, 'C', 1)
+    pdf.ln(10)
+
+    pdf.set_font("Arial", size=11)
+    clean_lines = []
+    for line in s_text.split('\n'):
+        if "Patient Name:" in line or "Age:" in line or "BP:" in line or "Notes:" in line or "Weight:" in line: continue
+        clean_lines.append(line)
+    for line in clean_lines:
+        line = line.strip()
+        if not line: pdf.ln(5); continue
+        if line.endswith(":") or "Diagnosis:" in line or "Rx:" in line:
+            pdf.set_font("Arial", 'B', 12)
+            pdf.cell(0, 8, line, ln=True)
+        else:
+            pdf.set_font("Arial", size=11)
+            pdf.multi_cell(0, 7, line)
+
+    if s_notes and s_notes != "--" and s_notes.strip() != "":
+        pdf.ln(10)
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(0, 8, "Clinical Notes:", ln=True)
+        pdf.set_font("Arial", 'I', 11)
+        pdf.multi_cell(0, 7, s_notes)
+    return pdf.output(dest='S').encode('latin-1', errors='replace')
+
+def send_email(sender, password, recipient, pdf_bytes, patient_name):
+    try:
+        msg = MIMEMultipart()
+        msg['From'] = sender
+        msg['To'] = recipient
+        msg['Subject'] = f"Prescription for {patient_name}"
+        msg.attach(MIMEText("Please find your medical prescription attached.", 'plain'))
+        part = MIMEBase('application', 'octet-stream')
+        part.set_payload(pdf_bytes)
+        encoders.encode_base64(part)
+        part.add_header('Content-Disposition', f"attachment; filename={patient_name}.pdf")
+        msg.attach(part)
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+        if SMTP_STARTTLS: server.starttls()
+        server.login(sender, password)
+        server.sendmail(sender, recipient, msg.as_string())
+        server.quit()
+        return True, "Email Sent Successfully"
+    except Exception as e:
+        return False, str(e)
+
+def get_whatsapp_link(phone, text):
+    final_msg = f"*Prescription Summary*\n\n{text}\n\n_(Official PDF attached below)_"
+    encoded = urllib.parse.quote(final_msg)
+    return f"https://wa.me/{phone}?text={encoded}"
@@ -0,0 +1,231 @@
+"""Host-wide cache shared by every Streamlit worker process.
+
+Several `streamlit run v2.py` processes behind a load balancer used to each
+parse patient_records.csv, re-render the same PDFs and re-run extraction on
+the same audio. Results now go into one SQLite file (WAL mode, so readers
+never block each other) under ASCLEPIUS_CACHE_DIR, and every worker on the
+host reuses them.
+
+Keys are versioned: callers pass a namespace version plus whatever the
+result depends on (the archive's inode/mtime/size, the PDF inputs, the
+audio hash), so a stale entry is simply never asked for again. While one
+worker computes a missing entry it holds a short lease; the others wait for
+its result instead of duplicating the work.
+
+The cache holds PHI (extractions, prescription PDFs, archive snapshots)
+and values are pickled, so the directory is created 0700 and the database
+0600, and a directory owned by another user or writable by others is
+refused. Per-visit entries (PDFs, extractions) expire after
+ASCLEPIUS_CACHE_PHI_TTL_HOURS, and deleted rows are overwritten on disk.
+
+The cache is an optimisation only: any SQLite problem (or a refused
+directory) falls back to computing in-process. Set ASCLEPIUS_CACHE=off to
+disable.
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import stat
+import threading
+import time
+import uuid
+
+CACHE_DIR = os.environ.get("ASCLEPIUS_CACHE_DIR", ".asclepius_cache")
+CACHE_FILE = os.path.join(CACHE_DIR, "shared_cache.sqlite3")
+MAX_BYTES = int(float(os.environ.get("ASCLEPIUS_CACHE_MB", 512)) * 1024 * 1024)
+ENABLED = os.environ.get("ASCLEPIUS_CACHE", "on").lower() not in ("0", "off", "false", "no")
+LEASE_SECONDS = 60
+# Namespaces holding a single visit's PHI are dropped after this long, even if never deleted
+PHI_TTL_SECONDS = float(os.environ.get("ASCLEPIUS_CACHE_PHI_TTL_HOURS", 24)) * 3600
+TTL_SECONDS = {"pdf": PHI_TTL_SECONDS, "extraction": PHI_TTL_SECONDS}
+POLL_SECONDS = 0.05
+# LRU eviction only needs coarse access times; a hit within this window is read-only
+ACCESS_RESOLUTION = 60
+
+_local = threading.local()
+_owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_stats = {"hits": 0, "misses": 0, "waits": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    ns TEXT NOT NULL, key TEXT NOT NULL, tag TEXT, value BLOB NOT NULL,
+    size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL,
+    PRIMARY KEY (ns, key)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS leases (
+    ns TEXT NOT NULL, key TEXT NOT NULL, owner TEXT NOT NULL, expires REAL NOT NULL,
+    PRIMARY KEY (ns, key)
+);
+"""
+
+
+# 1. CONNECTION
+def _check_private(path, st):
+    # Pickles load as code: never trust a cache someone else could have written
+    if hasattr(os, "getuid") and st.st_uid != os.getuid():
+        raise PermissionError(f"{path} is owned by another user; refusing to use it as the cache")
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"{path} is writable by other users; refusing to use it as the cache")
+
+def _secure_files():
+    cache_dir = os.path.dirname(CACHE_FILE) or "."
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    _check_private(cache_dir, os.stat(cache_dir))
+    os.chmod(cache_dir, 0o700)
+    # Create the database 0600 up front; SQLite gives its -wal/-shm files the same mode
+    os.close(os.open(CACHE_FILE, os.O_RDWR | os.O_CREAT, 0o600))
+    for path in (CACHE_FILE, CACHE_FILE + "-wal", CACHE_FILE + "-shm"):
+        if not os.path.exists(path): continue
+        _check_private(path, os.stat(path))
+        os.chmod(path, 0o600)
+
+def _conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != CACHE_FILE:
+        _secure_files()
+        conn = sqlite3.connect(CACHE_FILE, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Deleted PHI is zeroed on disk, not left in free pages
+        conn.execute("PRAGMA secure_delete=ON")
+        conn.executescript(SCHEMA)
+        _expire(conn, time.time())
+        _local.conn, _local.path = conn, CACHE_FILE
+    return conn
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+# 2. KEYS
+def make_key(version, *parts):
+    digest = hashlib.sha256(repr(parts).encode("utf-8", "surrogatepass")).hexdigest()
+    return f"{version}:{digest}"
+
+def file_version(path):
+    # os.replace() gives a new inode, so inode + mtime + size catches every rewrite
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_ino, st.st_mtime_ns, st.st_size)
+
+def bytes_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# 3. GET / PUT
+def get(ns, key):
+    row = _conn().execute("SELECT value, created, accessed FROM entries WHERE ns=? AND key=?", (ns, key)).fetchone()
+    if row is None: return False, None
+    now = time.time()
+    if ns in TTL_SECONDS and row[1] < now - TTL_SECONDS[ns]:
+        delete(ns, key)
+        return False, None
+    if row[2] < now - ACCESS_RESOLUTION:
+        _conn().execute("UPDATE entries SET accessed=? WHERE ns=? AND key=?", (now, ns, key))
+    return True, pickle.loads(row[0])
+
+def put(ns, key, value, tag=None):
+    blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    now = time.time()
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if tag is not None:
+            # A newer version of the same thing (e.g. the archive) supersedes the old ones
+            conn.execute("DELETE FROM entries WHERE ns=? AND tag=? AND key<>?", (ns, tag, key))
+        conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)", (ns, key, tag, blob, len(blob), now, now))
+        _expire(conn, now)
+        _evict(conn)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+def delete(ns, key):
+    _conn().execute("DELETE FROM entries WHERE ns=? AND key=?", (ns, key))
+
+def purge(ns, keys):
+    """Drop entries that must not outlive the record they came from; never raises."""
+    if not ENABLED: return
+    try:
+        for key in keys: delete(ns, key)
+    except Exception:
+        _count("errors")
+
+def _expire(conn, now):
+    for ns, ttl in TTL_SECONDS.items():
+        conn.execute("DELETE FROM entries WHERE ns=? AND created<?", (ns, now - ttl))
+
+def _evict(conn):
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    if total <= MAX_BYTES: return
+    target = int(MAX_BYTES * 0.9)
+    for ns, key, size in conn.execute("SELECT ns, key, size FROM entries ORDER BY accessed").fetchall():
+        conn.execute("DELETE FROM entries WHERE ns=? AND key=?", (ns, key))
+        total -= size
+        if total <= target: break
+
+def clear():
+    _conn().execute("DELETE FROM entries")
+    _conn().execute("DELETE FROM leases")
+
+
+# 4. SINGLE-FLIGHT COMPUTE
+def _take_lease(ns, key):
+    now = time.time()
+    conn = _conn()
+    conn.execute("DELETE FROM leases WHERE ns=? AND key=? AND expires<?", (ns, key, now))
+    cur = conn.execute("INSERT OR IGNORE INTO leases VALUES (?, ?, ?, ?)", (ns, key, _owner, now + LEASE_SECONDS))
+    return cur.rowcount == 1
+
+def _drop_lease(ns, key):
+    _conn().execute("DELETE FROM leases WHERE ns=? AND key=? AND owner=?", (ns, key, _owner))
+
+def _lease_held(ns, key):
+    row = _conn().execute("SELECT expires FROM leases WHERE ns=? AND key=?", (ns, key)).fetchone()
+    return row is not None and row[0] > time.time()
+
+def get_or_compute(ns, key, compute, tag=None):
+    """Return the cached value for (ns, key), computing it at most once per host."""
+    if not ENABLED: return compute()
+    try:
+        hit, value = get(ns, key)
+        if hit:
+            _count("hits")
+            return value
+        leased = _take_lease(ns, key)
+        if not leased:
+            _count("waits")
+            while _lease_held(ns, key):
+                time.sleep(POLL_SECONDS)
+                hit, value = get(ns, key)
+                if hit:
+                    _count("hits")
+                    return value
+            leased = _take_lease(ns, key)
+    except Exception:
+        # Corrupt entry, locked/missing cache file, unpicklable old value...
+        _count("errors")
+        return compute()
+
+    _count("misses")
+    try:
+        value = compute()
+        try:
+            put(ns, key, value, tag)
+        except Exception:
+            _count("errors")
+        return value
+    finally:
+        if leased:
+            try:
+                _drop_lease(ns, key)
+            except sqlite3.Error:
+                _count("errors")
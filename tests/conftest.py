@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# The app is a set of top-level modules, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    """scribe_core pointed at an empty archive and shared cache under tmp_path."""
+    pytest.importorskip("pandas")
+    pytest.importorskip("fpdf")
+    import patient_index
+    import scribe_core
+    import shared_cache
+    monkeypatch.setattr(scribe_core, "DB_FILE", str(tmp_path / "patient_records.csv"))
+    monkeypatch.setattr(shared_cache, "CACHE_FILE", str(tmp_path / "cache" / "shared_cache.sqlite3"))
+    monkeypatch.setattr(patient_index, "_index", None)
+    monkeypatch.setattr(patient_index, "_synced", None)
+    return scribe_core
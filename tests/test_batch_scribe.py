@@ -0,0 +1,95 @@
+import json
+import os
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+EXTRACTION = "Name: {name}\nAge: 45\nBP: 130/85\nPulse: 78\nRx: Paracetamol 650 mg BD"
+
+
+class StubGroq:
+    """Answers like the Groq client; recordings whose bytes start with b"bad" fail."""
+    def __init__(self, name="Ramesh Kumar"):
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self._transcribe))
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._complete))
+        self.name = name
+
+    def _transcribe(self, file, **kwargs):
+        if file[1].startswith(b"bad"): raise RuntimeError("transcription failed")
+        return "transcript"
+
+    def _complete(self, **kwargs):
+        message = SimpleNamespace(content=EXTRACTION.format(name=self.name))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def batch(archive, tmp_path):
+    import batch_scribe
+    folder = tmp_path / "recordings"
+    folder.mkdir()
+    return batch_scribe, folder, tmp_path / "out"
+
+
+def write_recording(folder, name, data, when=None):
+    path = folder / name
+    path.write_bytes(data)
+    if when: os.utime(path, (when.timestamp(), when.timestamp()))
+    return path
+
+
+def test_resume_processes_only_unarchived_recordings(batch, archive):
+    batch_scribe, folder, out = batch
+    write_recording(folder, "a.wav", b"ok-a")
+    write_recording(folder, "b.wav", b"ok-b")
+    bad = write_recording(folder, "c.wav", b"bad-c")
+    logs = []
+
+    archived, failed = batch_scribe.run_batch(StubGroq(), str(folder), "Dr. A", str(out), batch_size=1, log=logs.append)
+    assert (archived, [os.path.basename(p) for p in failed]) == (2, ["c.wav"])
+
+    # Fix the recording and resume: only it is processed
+    bad.write_bytes(b"ok-c")
+    archived, failed = batch_scribe.run_batch(StubGroq(), str(folder), "Dr. A", str(out), log=logs.append)
+    assert (archived, failed) == (1, [])
+    assert "1 recording(s) to process, 2 already archived." in logs
+
+    ledger = [json.loads(line) for line in (out / batch_scribe.LEDGER_NAME).read_text().splitlines()]
+    assert sorted(e["file"] for e in ledger) == ["a.wav", "b.wav", "c.wav"]
+    assert all(e["pdf"] and (out / e["pdf"]).exists() for e in ledger)
+    assert len(archive.load_data()) == 3
+
+
+def test_lost_ledger_never_duplicates_archived_visits(batch, archive):
+    batch_scribe, folder, out = batch
+    write_recording(folder, "a.wav", b"ok-a")
+    write_recording(folder, "b.wav", b"ok-b")
+    assert batch_scribe.run_batch(StubGroq(), str(folder), "Dr. A", str(out), log=lambda m: None) == (2, [])
+
+    # Crash between the archive write and the ledger append
+    os.remove(out / batch_scribe.LEDGER_NAME)
+    assert batch_scribe.run_batch(StubGroq(), str(folder), "Dr. A", str(out), log=lambda m: None) == (0, [])
+    assert len(archive.load_data()) == 2
+
+
+def test_unsafe_patient_name_still_archives(batch, archive):
+    batch_scribe, folder, out = batch
+    write_recording(folder, "a.wav", b"ok-a")
+    assert batch_scribe.run_batch(StubGroq("Ramesh S/O Suresh Kumar"), str(folder), "Dr. A", str(out), log=lambda m: None) == (1, [])
+    assert (out / "a_Ramesh_S_O_Suresh_Kumar_Prescription.pdf").exists()
+
+
+def test_pdf_prints_the_visit_date_not_the_run_date(batch, archive, monkeypatch):
+    batch_scribe, folder, out = batch
+    visit = datetime(2024, 3, 5, 10, 30)
+    write_recording(folder, "a.wav", b"ok-a", when=visit)
+    printed = []
+    render = archive._render_pdf
+    monkeypatch.setattr(archive, "_render_pdf", lambda *args: printed.append(args[-1]) or render(*args))
+
+    batch_scribe.run_batch(StubGroq(), str(folder), "Dr. A", str(out), log=lambda m: None)
+
+    assert [d.strftime("%Y-%m-%d %H:%M") for d in printed] == ["2024-03-05 10:30"]
+    row = archive.load_data().iloc[0]
+    assert (row["Date"], row["Time"]) == ("2024-03-05", "10:30")
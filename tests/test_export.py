@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+
+@pytest.fixture
+def visits(archive):
+    import export
+    def visit(name, day, notes="--", when="10:00"):
+        rec = archive.build_record("Dr. A", name, "45", "See Rx", "Paracetamol 650 mg twice daily", notes, "120/80", "72", "--", "--",
+                                   when=datetime.strptime(f"{day} {when}", "%Y-%m-%d %H:%M"))
+        return rec
+    archive.save_records([
+        visit("Ramesh Kumar", "2024-01-10", notes="Review in a week"),
+        visit("Sita Devi", "2024-02-15"),
+        visit("Ramesh Kumar", "2024-03-20"),
+    ])
+    return export
+
+
+def render(export, fmt, start=None, end=None):
+    return "".join(export.export_stream(fmt, start, end, chunksize=2))
+
+
+def has_empty_array(node):
+    if isinstance(node, list): return not node or any(has_empty_array(x) for x in node)
+    if isinstance(node, dict): return any(has_empty_array(v) for v in node.values())
+    return False
+
+
+def test_csv_round_trips_every_visit(visits, archive):
+    rows = list(csv.DictReader(io.StringIO(render(visits, "csv"))))
+    assert [r["Patient Name"] for r in sorted(rows, key=lambda r: r["Date"])] == ["Ramesh Kumar", "Sita Devi", "Ramesh Kumar"]
+    assert list(rows[0]) == archive.COLUMNS
+
+
+def test_empty_range_still_writes_the_csv_header(visits, archive):
+    out = render(visits, "csv", "2030-01-01", "2030-12-31")
+    assert out == ",".join(archive.COLUMNS) + "\r\n"
+
+
+def test_ndjson_filters_by_date(visits):
+    lines = render(visits, "ndjson", "2024-02-01", "2024-03-31").splitlines()
+    assert sorted(json.loads(line)["Date"] for line in lines) == ["2024-02-15", "2024-03-20"]
+
+
+def test_fhir_bundle_is_valid_json_with_one_patient_per_id(visits):
+    bundle = json.loads(render(visits, "fhir"))
+    resources = [e["resource"] for e in bundle["entry"]]
+    urls = [e["fullUrl"] for e in bundle["entry"]]
+    assert bundle["resourceType"] == "Bundle"
+    assert len(urls) == len(set(urls))
+    patients = [r for r in resources if r["resourceType"] == "Patient"]
+    assert sorted(p["name"][0]["text"] for p in patients) == ["Ramesh Kumar", "Sita Devi"]
+    assert sum(r["resourceType"] == "Encounter" for r in resources) == 3
+    assert not has_empty_array(bundle)
+    notes = [r.get("note") for r in resources if r["resourceType"] == "MedicationRequest"]
+    assert sorted(notes, key=str) == [None, None, [{"text": "Review in a week"}]]
+
+
+def test_fhir_urls_are_stable_across_date_ranges(visits):
+    def urls(start=None, end=None):
+        bundle = json.loads(render(visits, "fhir", start, end))
+        return {e["fullUrl"] for e in bundle["entry"]}
+    march = urls("2024-03-01", "2024-03-31")
+    assert march and march <= urls()
+
+
+def test_empty_fhir_bundle_is_valid_json(visits):
+    assert json.loads(render(visits, "fhir", "2030-01-01")) == {"resourceType": "Bundle", "type": "collection", "entry": []}
+
+
+@pytest.mark.parametrize("flag, value", [("--start", "2024-02-30"), ("--end", "05/01/2024"), ("--start", "2024-13-01")])
+def test_cli_rejects_malformed_dates(visits, flag, value, capsys):
+    with pytest.raises(SystemExit) as exit:
+        visits.main([flag, value])
+    assert exit.value.code == 2
+    assert "YYYY-MM-DD" in capsys.readouterr().err
+
+
+def test_cli_pads_short_dates_and_rejects_inverted_ranges(visits, capsys):
+    visits.main(["--format", "ndjson", "--start", "2024-3-1"])
+    assert [json.loads(line)["Date"] for line in capsys.readouterr().out.splitlines()] == ["2024-03-20"]
+    with pytest.raises(SystemExit):
+        visits.main(["--start", "2024-03-01", "--end", "2024-02-01"])
+
+
+def test_ui_spool_is_capped(visits):
+    with pytest.raises(ValueError, match="narrow the date range"):
+        visits.spool_export("fhir", max_bytes=100)
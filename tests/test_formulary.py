@@ -0,0 +1,32 @@
+import pytest
+
+from formulary import normalize_rx
+
+
+@pytest.mark.parametrize("line, heard, nearest", [
+    ("Prednisone 20 mg OD", "Prednisone", "Prednisolone"),
+    ("Tab Saxagliptin 5mg OD", "Saxagliptin", "Sitagliptin"),
+    ("Ampicillin 500mg TDS", "Ampicillin", "Amoxicillin"),
+    ("Tab. Paracetmol 650mg BD", "Paracetmol", "Paracetamol"),
+])
+def test_fuzzy_match_is_a_warning_not_a_rewrite(line, heard, nearest):
+    text, warnings = normalize_rx(line)
+    assert heard in text
+    assert nearest not in text
+    assert warnings == [f"{heard}: not in the formulary. Did you mean {nearest}?"]
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("Dolo 650 BD", "Paracetamol 650 twice daily"),
+    ("Crocin 500mg, Pan 40mg OD", "Paracetamol 500 mg, Pantoprazole 40 mg once daily"),
+    ("Ultracet 1 tab SOS", "Tramadol Paracetamol 1 tab as needed"),
+    ("Meftal-Spas 1-0-1", "Mefenamic Acid Dicyclomine twice daily"),
+])
+def test_exact_aliases_are_rewritten(line, expected):
+    assert normalize_rx(line) == (expected, [])
+
+
+def test_unlisted_strength_is_flagged():
+    text, warnings = normalize_rx("Paracetamol 250mg BD")
+    assert text == "Paracetamol 250 mg twice daily"
+    assert warnings == ["Paracetamol: 250 mg is not a listed strength (500 mg, 650 mg, 1000 mg)"]
@@ -0,0 +1,134 @@
+import threading
+import time
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+
+from fake_groq import start_fake_groq
+from groq_governor import Governor
+
+
+class FakeAPIError(Exception):
+    # Shaped like groq.APIStatusError: status_code plus a response with headers
+    def __init__(self, err):
+        super().__init__(f"HTTP {err.code}")
+        self.status_code = err.code
+        self.response = SimpleNamespace(status_code=err.code, headers={k.lower(): v for k, v in err.headers.items()})
+
+
+def post(url):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(f"{url}/openai/v1/chat/completions", data=b"{}", method="POST")) as res:
+            return res.status
+    except urllib.error.HTTPError as e:
+        raise FakeAPIError(e) from None
+
+
+@pytest.fixture
+def fake_groq():
+    servers = []
+    def start(**kwargs):
+        server, url = start_fake_groq(**kwargs)
+        servers.append(server)
+        return server, url
+    yield start
+    for server in servers: server.shutdown()
+
+
+def run_threads(targets):
+    threads = [threading.Thread(target=fn) for fn in targets]
+    for t in threads: t.start()
+    for t in threads: t.join(30)
+
+
+def test_in_flight_cap_is_never_exceeded(fake_groq):
+    server, url = fake_groq(latency=0.05, jitter=0.01)
+    governor = Governor(rate=1000, burst=1000, max_in_flight=3)
+    lock, current, peak, results = threading.Lock(), [0], [0], []
+
+    def call():
+        with lock:
+            current[0] += 1
+            peak[0] = max(peak[0], current[0])
+        try:
+            return post(url)
+        finally:
+            with lock: current[0] -= 1
+
+    targets = [lambda d=d: results.append(governor.call(d, call)) for d in ("a", "b", "c", "d") for _ in range(5)]
+    run_threads(targets)
+
+    assert results == [200] * 20
+    assert peak[0] == 3
+    assert server.stats["peak_in_flight"] <= 3
+    assert governor.snapshot()["in_flight"] == 0
+
+
+def test_retries_on_429_and_503(fake_groq):
+    server, url = fake_groq(latency=0.0, jitter=0.0, rate_limit_rate=0.3, error_rate=0.3, retry_after=0)
+    governor = Governor(rate=1000, burst=1000, max_in_flight=4, max_retries=40, base_delay=0.001, max_delay=0.01)
+    results = []
+
+    run_threads([lambda i=i: results.append(governor.call(f"dr-{i % 3}", post, url)) for i in range(40)])
+
+    stats = governor.snapshot()
+    assert results == [200] * 40
+    assert stats["failed"] == 0
+    assert stats["throttled"] == server.stats["429"] > 0
+    assert stats["server_errors"] == server.stats["5xx"] > 0
+    assert stats["retries"] == stats["throttled"] + stats["server_errors"]
+
+
+def test_non_retryable_errors_are_raised_at_once():
+    governor = Governor(max_retries=5, base_delay=0.001)
+    err = FakeAPIError(SimpleNamespace(code=400, headers={}))
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise err
+
+    with pytest.raises(FakeAPIError):
+        governor.call("a", bad_request)
+    assert len(calls) == 1
+    assert governor.snapshot()["failed"] == 1
+
+
+def test_doctors_take_turns(fake_groq):
+    _, url = fake_groq(latency=0.0, jitter=0.0)
+    governor = Governor(rate=1000, burst=1000, max_in_flight=1)
+    order = []
+
+    def call(doctor):
+        order.append(doctor)
+        return post(url)
+
+    def wait_queued(doctor, n):
+        deadline = time.monotonic() + 5
+        while governor.snapshot()["queued_by_doctor"].get(doctor, 0) < n:
+            assert time.monotonic() < deadline
+            time.sleep(0.005)
+
+    # Hold the only slot so both doctors queue up: all of A's requests before any of B's
+    governor.acquire("warmup")
+    threads = []
+    for doctor in ("a", "b"):
+        for _ in range(4):
+            t = threading.Thread(target=governor.call, args=(doctor, call, doctor))
+            t.start()
+            threads.append(t)
+        wait_queued(doctor, 4)
+    governor.release()
+    for t in threads: t.join(10)
+
+    assert order == ["a", "b"] * 4
+
+
+def test_retry_after_is_capped_at_max_delay():
+    governor = Governor(base_delay=0.01, max_delay=2.0)
+    err = FakeAPIError(SimpleNamespace(code=429, headers={"Retry-After": "3600"}))
+    assert all(governor.backoff(0, err) == 2.0 for _ in range(20))
+    short = FakeAPIError(SimpleNamespace(code=429, headers={"Retry-After": "1"}))
+    assert all(1.0 <= governor.backoff(0, short) <= 2.0 for _ in range(20))
@@ -0,0 +1,99 @@
+import pytest
+
+from patient_index import PatientIndex
+
+VISIT = "2025-06-01"
+
+
+def index_with(*visits):
+    idx = PatientIndex()
+    pids = [idx.assign(name, age, VISIT) for name, age in visits]
+    return idx, pids
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Ramesh Kumar", "Rajesh Kumar"),
+    ("Anita Singh", "Amita Singh"),
+    ("Sunil Sharma", "Sushil Sharma"),
+    ("Mahesh Patel", "Mukesh Patel"),
+    ("Rekha Gupta", "Renu Gupta"),
+    ("Pooja Verma", "Puja Verma"),
+    ("Sita Devi", "Gita Devi"),
+])
+def test_one_letter_first_names_are_different_patients(first, second):
+    idx, (a, b) = index_with((first, "45"), (second, "46"))
+    assert a != b
+    assert len(idx) == 2
+
+
+@pytest.mark.parametrize("later", ["Ramesh Kumar", "ramesh kumar", "Mr. Ramesh Kumar", "R. Kumar", "Ramesh Kumaar"])
+def test_repeat_visits_link(later):
+    idx, (a, b) = index_with(("Ramesh Kumar", "45"), (later, "46"))
+    assert a == b
+    assert idx.visits(a) == 2
+
+
+def test_initial_is_ambiguous_between_two_patients():
+    idx, _ = index_with(("Ramesh Kumar", "45"), ("Rajesh Kumar", "45"))
+    assert idx.match("R. Kumar", "45", VISIT) is None
+
+
+def test_age_gap_keeps_patients_apart():
+    _, (a, b) = index_with(("Ramesh Kumar", "45"), ("Ramesh Kumar", "12"))
+    assert a != b
+
+
+def _save_from_other_process(db_file, cache_file, name):
+    import scribe_core
+    import shared_cache
+    scribe_core.DB_FILE, shared_cache.CACHE_FILE = db_file, cache_file
+    scribe_core.save_data("Dr. B", name, "30", "See Rx", "ORS", "--", "--", "--", "--", "--")
+
+
+def test_rows_appended_by_another_process_are_indexed_without_a_rebuild(archive, monkeypatch):
+    import multiprocessing
+    import patient_index
+    import shared_cache
+    archive.save_data("Dr. A", "Ramesh Kumar", "45", "See Rx", "Paracetamol", "--", "--", "--", "--", "--")
+    before = open(archive.DB_FILE, "rb").read()
+    ramesh = patient_index.find_patient("Ramesh Kumar", "45")
+
+    p = multiprocessing.get_context("spawn").Process(target=_save_from_other_process, args=(archive.DB_FILE, shared_cache.CACHE_FILE, "Sita Devi"))
+    p.start()
+    p.join(120)
+    assert open(archive.DB_FILE, "rb").read().startswith(before)
+
+    def rebuild(df): raise AssertionError("full rebuild")
+    monkeypatch.setattr(patient_index, "build_index", rebuild)
+    sita = patient_index.find_patient("Sita Devi", "30")
+    assert sita and sita != ramesh
+    assert set(archive.load_data()["Patient ID"]) == {ramesh, sita}
+
+
+def test_delete_rebuilds_the_index(archive):
+    import patient_index
+    for _ in range(2):
+        archive.save_data("Dr. A", "Ramesh Kumar", "45", "See Rx", "Paracetamol", "--", "--", "--", "--", "--")
+    pid = patient_index.find_patient("Ramesh Kumar", "45")
+    assert patient_index.patient_visits(pid) == 2
+    archive.delete_record(archive.load_data().index[0])
+    assert patient_index.patient_visits(pid) == 1
+
+
+def test_backfill_writes_ids_under_the_archive_lock(archive, monkeypatch):
+    import patient_index
+    columns = [c for c in archive.COLUMNS if c != "Patient ID"]
+    legacy = [dict.fromkeys(columns, "--") | {"Date": d, "Time": "10:00", "Patient Name": n, "Age": "45"}
+              for d, n in [("2024-01-01", "Ramesh Kumar"), ("2024-02-01", "R. Kumar"), ("2024-03-01", "Sita Devi")]]
+    archive.pd.DataFrame(legacy, columns=columns).to_csv(archive.DB_FILE, index=False)
+    write = archive._write_data
+    def locked_write(df):
+        assert archive._lock_depth > 0
+        write(df)
+    monkeypatch.setattr(archive, "_write_data", locked_write)
+
+    pid = patient_index.find_patient("Ramesh Kumar", "45")
+    df = archive.load_data()
+    assert sorted(df["Patient ID"]) == sorted([pid, pid, patient_index.find_patient("Sita Devi", "45")])
+    # Written back in file order, so later saves stay appends
+    assert list(df.sort_index()["Date"]) == ["2024-01-01", "2024-02-01", "2024-03-01"]
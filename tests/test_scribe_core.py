@@ -0,0 +1,75 @@
+import multiprocessing
+
+import pytest
+
+EXTRACTION = """Name: Ramesh Kumar
+Age: 45
+BP: 130/85
+Pulse: 78
+Weight: --
+Temp: 101
+Diagnosis: Viral fever
+Rx: Paracetamol 650 mg, twice daily, 5 days
+Notes: Review if fever persists"""
+
+
+def test_parse_extraction():
+    pytest.importorskip("pandas")
+    pytest.importorskip("fpdf")
+    from scribe_core import parse_extraction
+    fields = parse_extraction(EXTRACTION)
+    assert fields == {
+        "name": "Ramesh Kumar", "age": "45", "bp": "130/85", "pulse": "78", "weight": "--", "temp": "101",
+        "notes": "Review if fever persists",
+        "rx": "Diagnosis: Viral fever\nRx: Paracetamol 650 mg, twice daily, 5 days",
+    }
+
+
+def test_parse_extraction_accepts_patient_name_and_blank_lines():
+    pytest.importorskip("pandas")
+    pytest.importorskip("fpdf")
+    from scribe_core import parse_extraction
+    fields = parse_extraction("Patient Name: Sita Devi\n\nRx: ORS sachet\n")
+    assert fields["name"] == "Sita Devi"
+    assert fields["rx"] == "Rx: ORS sachet"
+    assert fields["age"] == ""
+
+
+def record(core, name, recording=None):
+    rec = core.build_record("Dr. A", name, "40", "See Rx", "Paracetamol 650 mg", "--", "120/80", "72", "--", "--")
+    if recording: rec["Recording"] = recording
+    return rec
+
+
+def test_save_records_skips_recordings_already_archived(archive):
+    assert archive.save_records([record(archive, "Ramesh Kumar", "a.wav|1|1"), record(archive, "Sita Devi", "b.wav|1|1")]) == 2
+    # A replayed batch (ledger lost after the archive write) adds nothing
+    assert archive.save_records([record(archive, "Ramesh Kumar", "a.wav|1|1"), record(archive, "Sita Devi", "b.wav|1|1")]) == 0
+    # UI visits carry no recording key and are never treated as duplicates
+    assert archive.save_records([record(archive, "Ramesh Kumar"), record(archive, "Ramesh Kumar")]) == 2
+    df = archive.load_data()
+    assert len(df) == 4
+    assert sorted(df["Recording"].fillna("--")) == ["--", "--", "a.wav|1|1", "b.wav|1|1"]
+
+
+def _save_from_other_process(db_file, cache_file, prefix, n):
+    import scribe_core
+    import shared_cache
+    scribe_core.DB_FILE, shared_cache.CACHE_FILE = db_file, cache_file
+    for i in range(n):
+        scribe_core.save_records([record(scribe_core, f"{prefix} Patient{i}")])
+
+
+def test_concurrent_writers_in_two_processes_lose_nothing(archive):
+    import shared_cache
+    ctx = multiprocessing.get_context("spawn")
+    others = [ctx.Process(target=_save_from_other_process, args=(archive.DB_FILE, shared_cache.CACHE_FILE, p, 15)) for p in ("Batch", "Worker")]
+    for p in others: p.start()
+    for i in range(15):
+        archive.save_records([record(archive, f"Clinic Patient{i}")])
+    for p in others: p.join(120)
+
+    df = archive.load_data()
+    assert len(df) == 45
+    # Every distinct patient got a distinct ID, whichever process assigned it
+    assert df["Patient ID"].nunique() == 45
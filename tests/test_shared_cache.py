@@ -0,0 +1,124 @@
+import multiprocessing
+import os
+import stat
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import shared_cache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_cache, "CACHE_FILE", str(tmp_path / "cache" / "shared_cache.sqlite3"))
+    monkeypatch.setattr(shared_cache, "ENABLED", True)
+    return shared_cache
+
+
+def advance_clock(monkeypatch, seconds):
+    now = time.time() + seconds
+    monkeypatch.setattr(shared_cache, "time", SimpleNamespace(time=lambda: now, sleep=time.sleep))
+
+
+def test_files_are_private(cache):
+    cache.put("pdf", "k", b"%PDF")
+    cache_dir = os.path.dirname(cache.CACHE_FILE)
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+    for path in (cache.CACHE_FILE, cache.CACHE_FILE + "-wal"):
+        if os.path.exists(path):
+            assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_refuses_a_directory_others_can_write(cache):
+    cache_dir = os.path.dirname(cache.CACHE_FILE)
+    os.makedirs(cache_dir)
+    os.chmod(cache_dir, 0o777)
+    with pytest.raises(PermissionError, match="writable by other users"):
+        cache.get("pdf", "k")
+    # Callers fall back to computing in-process
+    errors = cache.stats()["errors"]
+    assert cache.get_or_compute("pdf", "k", lambda: "fresh") == "fresh"
+    assert cache.stats()["errors"] == errors + 1
+    assert not os.path.exists(cache.CACHE_FILE)
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX ownership")
+def test_refuses_a_directory_owned_by_someone_else(cache, monkeypatch):
+    os.makedirs(os.path.dirname(cache.CACHE_FILE), mode=0o700)
+    monkeypatch.setattr(os, "getuid", lambda: os.stat(os.path.dirname(cache.CACHE_FILE)).st_uid + 1)
+    with pytest.raises(PermissionError, match="owned by another user"):
+        cache.get("pdf", "k")
+
+
+def test_phi_entries_expire(cache, monkeypatch):
+    cache.put("pdf", "k", b"%PDF")
+    cache.put("archive", "k", "snapshot")
+    assert cache.get("pdf", "k") == (True, b"%PDF")
+    advance_clock(monkeypatch, cache.PHI_TTL_SECONDS + 1)
+    assert cache.get("pdf", "k") == (False, None)
+    assert cache.get("archive", "k") == (True, "snapshot")
+
+
+def test_purge_drops_only_the_given_keys(cache):
+    for key in ("a", "b", "c"):
+        cache.put("pdf", key, key)
+    cache.purge("pdf", ["a", "c", "missing"])
+    assert [cache.get("pdf", key)[0] for key in ("a", "b", "c")] == [False, True, False]
+
+
+def test_purge_never_raises(cache):
+    os.makedirs(os.path.dirname(cache.CACHE_FILE))
+    os.chmod(os.path.dirname(cache.CACHE_FILE), 0o777)
+    cache.purge("pdf", ["a"])
+
+
+def test_tag_supersedes_older_versions(cache):
+    cache.put("archive", "v1", "old", tag="records.csv")
+    cache.put("archive", "other", "kept", tag="other.csv")
+    cache.put("archive", "v2", "new", tag="records.csv")
+    assert cache.get("archive", "v1") == (False, None)
+    assert cache.get("archive", "v2") == (True, "new")
+    assert cache.get("archive", "other") == (True, "kept")
+
+
+def test_hits_only_write_once_per_access_resolution(cache, monkeypatch):
+    cache.put("archive", "k", "snapshot")
+    conn = cache._conn()
+    writes = conn.total_changes
+    for _ in range(5):
+        assert cache.get("archive", "k") == (True, "snapshot")
+    assert conn.total_changes == writes
+    advance_clock(monkeypatch, cache.ACCESS_RESOLUTION + 1)
+    cache.get("archive", "k")
+    cache.get("archive", "k")
+    assert conn.total_changes == writes + 1
+
+
+def _compute_once(cache_file, marker, barrier, results):
+    import shared_cache
+    shared_cache.CACHE_FILE, shared_cache.ENABLED = cache_file, True
+
+    def compute():
+        with open(marker, "a") as f: f.write("x")
+        time.sleep(1.0)
+        return "rendered"
+    barrier.wait()
+    value = shared_cache.get_or_compute("pdf", "same-key", compute)
+    results.put((value, shared_cache.stats()))
+
+
+def test_single_flight_across_processes(cache, tmp_path):
+    ctx = multiprocessing.get_context("spawn")
+    barrier, results = ctx.Barrier(4), ctx.Queue()
+    marker = str(tmp_path / "computed")
+    cache.put("pdf", "warm-up", None)   # create the database before the race
+    workers = [ctx.Process(target=_compute_once, args=(cache.CACHE_FILE, marker, barrier, results)) for _ in range(4)]
+    for p in workers: p.start()
+    outcomes = [results.get(timeout=120) for _ in workers]
+    for p in workers: p.join(120)
+
+    assert open(marker).read() == "x"
+    assert [value for value, _ in outcomes] == ["rendered"] * 4
+    assert sum(s["misses"] for _, s in outcomes) == 1
+    assert sum(s["waits"] for _, s in outcomes) == 3
@@ -1,17 +1,16 @@
 import streamlit as st
 from groq import Groq
-from fpdf import FPDF
-import pandas as pd
 import os
-import re
-import smtplib
 import json
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
-import urllib.parse
 from datetime import datetime
+from scribe_core import (
+    clean_text_forcefully, clean_nan, load_data, save_data, delete_record,
+    create_pdf, send_email, get_whatsapp_link, analyze_audio
+)
+from groq_governor import governed, get_governor
+from export import FORMATS, UI_EXPORT_MAX_BYTES, spool_export
+from patient_index import find_patient, patient_visits
+from formulary import normalize_rx, suggest
 
 # 1. PAGE SETUP
 st.set_page_config(layout="wide", page_title="Asclepius V16 Gatekeeper", page_icon="⚕️")
@@ -103,136 +102,13 @@ saved_config = load_settings()
 if "email_user" not in st.session_state: st.session_state.email_user = saved_config["email_user"]
 if "email_pass" not in st.session_state: st.session_state.email_pass = saved_config["email_pass"]
 
-# 4. HELPER FUNCTIONS
-DB_FILE = "patient_records.csv"
-COLUMNS = ["Date", "Time", "Doctor", "Patient Name", "Age", "Diagnosis", "Full_Prescription", "Doctors_Notes", "BP", "Pulse", "Weight", "Temp"]
-
-def clean_text_forcefully(text):
-    if not isinstance(text, str): return str(text)
-    text = re.sub(r'Here is the.*?:', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'Sure, I can.*', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'Based on.*', '', text, flags=re.IGNORECASE)
-    clean = text.encode('ascii', 'ignore').decode('ascii').strip()
-    return clean
-
-def clean_nan(val):
-    if val is None or pd.isna(val) or str(val).lower() == 'nan': return "--"
-    return str(val)
-
-def load_data():
-    if not os.path.exists(DB_FILE):
-        return pd.DataFrame(columns=COLUMNS)
-    df = pd.read_csv(DB_FILE)
-    for col in COLUMNS:
-        if col not in df.columns: df[col] = "--"
-    for col in ["Patient Name", "Diagnosis", "Full_Prescription", "Doctors_Notes"]:
-        df[col] = df[col].astype(str).apply(clean_text_forcefully)
-    return df.sort_values(by=["Date", "Time"], ascending=[False, False])
-
-def save_data(doctor, name, age, diagnosis, full_text, notes, bp, pulse, weight, temp):
-    df = load_data()
-    new_entry = pd.DataFrame({
-        "Date": [datetime.now().strftime("%Y-%m-%d")],
-        "Time": [datetime.now().strftime("%H:%M")],
-        "Doctor": [doctor],
-        "Patient Name": [name], "Age": [age], "Diagnosis": [diagnosis],
-        "Full_Prescription": [full_text], "Doctors_Notes": [notes],
-        "BP": [bp], "Pulse": [pulse], "Weight": [weight], "Temp": [temp]
-    })
-    df = pd.concat([df, new_entry], ignore_index=True)
-    df.to_csv(DB_FILE, index=False)
-
-def delete_record(index):
-    df = load_data()
-    df = df.drop(index)
-    df.to_csv(DB_FILE, index=False)
-
-def create_pdf(doctor_name, name, age, text, notes, vitals):
-    s_doctor = clean_text_forcefully(doctor_name)
-    s_name = clean_text_forcefully(name)
-    s_age = clean_text_forcefully(age)
-    s_text = clean_text_forcefully(text)
-    s_notes = clean_text_forcefully(notes)
-    
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Times", 'B', 24)
-    pdf.cell(0, 10, "ASCLEPIUS MEDICAL CENTER", ln=True, align='C')
-    pdf.set_font("Times", 'I', 12)
-    pdf.cell(0, 10, f"Physician: {s_doctor}", ln=True, align='C')
-    pdf.line(10, 30, 200, 30)
-    pdf.ln(15)
-    
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(100, 10, f"Patient: {s_name}", ln=0)
-    pdf.cell(90, 10, f"Age: {s_age} | Date: {datetime.now().strftime('%Y-%m-%d')}", ln=1, align='R')
-    pdf.ln(5)
-
-    pdf.set_font("Arial", 'B', 10)
-    pdf.set_fill_color(240, 240, 240)
-    v_bp = clean_text_forcefully(vitals.get('BP', '--'))
-    v_pulse = clean_text_forcefully(vitals.get('Pulse', '--'))
-    v_weight = clean_text_forcefully(vitals.get('Weight', '--'))
-    v_temp = clean_text_forcefully(vitals.get('Temp', '--'))
-    pdf.cell(45, 8, f"BP: {v_bp}", 1, 0, 'C', 1)
-    pdf.cell(45, 8, f"Pulse: {v_pulse} bpm", 1, 0, 'C', 1)
-    pdf.cell(45, 8, f"Weight: {v_weight} kg", 1, 0, 'C', 1)
-    pdf.cell(45, 8, f"Temp: {v_temp} F", 1, 1, 'C', 1)
-    pdf.ln(10)
-
-    pdf.set_font("Arial", size=11)
-    clean_lines = []
-    for line in s_text.split('\n'):
-        if "Patient Name:" in line or "Age:" in line or "BP:" in line or "Notes:" in line or "Weight:" in line: continue
-        clean_lines.append(line)
-    for line in clean_lines:
-        line = line.strip()
-        if not line: pdf.ln(5); continue
-        if line.endswith(":") or "Diagnosis:" in line or "Rx:" in line:
-            pdf.set_font("Arial", 'B', 12)
-            pdf.cell(0, 8, line, ln=True)
-        else:
-            pdf.set_font("Arial", size=11)
-            pdf.multi_cell(0, 7, line)
-
-    if s_notes and s_notes != "--" and s_notes.strip() != "":
-        pdf.ln(10)
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(0, 8, "Clinical Notes:", ln=True)
-        pdf.set_font("Arial", 'I', 11)
-        pdf.multi_cell(0, 7, s_notes)
-    return pdf.output(dest='S').encode('latin-1', errors='replace')
-
-def send_email(sender, password, recipient, pdf_bytes, patient_name):
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = sender
-        msg['To'] = recipient
-        msg['Subject'] = f"Prescription for {patient_name}"
-        msg.attach(MIMEText("Please find your medical prescription attached.", 'plain'))
-        part = MIMEBase('application', 'octet-stream')
-        part.set_payload(pdf_bytes)
-        encoders.encode_base64(part)
-        part.add_header('Content-Disposition', f"attachment; filename={patient_name}.pdf")
-        msg.attach(part)
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender, password)
-        server.sendmail(sender, recipient, msg.as_string())
-        server.quit()
-        return True, "Email Sent Successfully"
-    except Exception as e:
-        return False, str(e)
-
-def get_whatsapp_link(phone, text):
-    final_msg = f"*Prescription Summary*\n\n{text}\n\n_(Official PDF attached below)_"
-    encoded = urllib.parse.quote(final_msg)
-    return f"https://wa.me/{phone}?text={encoded}"
+# 4. HELPER FUNCTIONS (shared with the batch CLI, see scribe_core.py)
 
+# Retries are owned by groq_governor (shared across every session in this process)
 try:
-    client = Groq(api_key=st.secrets["GROQ_API_KEY"])
+    client = Groq(api_key=st.secrets["GROQ_API_KEY"], max_retries=0)
 except:
-    client = Groq(api_key="YOUR_API_KEY_HERE_IF_LOCAL")
+    client = Groq(api_key="YOUR_API_KEY_HERE_IF_LOCAL", max_retries=0)
 
 
 # ==========================================
@@ -282,6 +158,7 @@ else:
 
         if "draft_rx" not in st.session_state: st.session_state.draft_rx = ""
         if "draft_notes" not in st.session_state: st.session_state.draft_notes = ""
+        if "rx_warnings" not in st.session_state: st.session_state.rx_warnings = []
         if "v_name" not in st.session_state: st.session_state.v_name = ""
         if "v_age" not in st.session_state: st.session_state.v_age = ""
         if "v_bp" not in st.session_state: st.session_state.v_bp = ""
@@ -295,53 +172,16 @@ else:
             st.markdown("### 1. Audio Input")
             audio = st.audio_input("Recorder")
             if audio and st.button("Analyze Audio ⚡"):
-                transcription = client.audio.transcriptions.create(file=("rec.wav", audio), model="whisper-large-v3", response_format="text")
-                
-                system_prompt = """
-                You are a Medical Translator and Data Extraction Engine.
-                STEP 1: TRANSLATE Hindi/Hinglish to ENGLISH.
-                STEP 2: EXTRACT.
-                CRITICAL RULES:
-                1. DO NOT include introductory text.
-                2. Output ONLY the keys and values.
-                3. For Medications (Rx), capture Dosage, Frequency, and Duration.
-                
-                Format (Key: Value):
-                Name: [Name in English]
-                Age: [Age or '--']
-                BP: [BP or '--']
-                Pulse: [Pulse or '--']
-                Weight: [Weight or '--']
-                Temp: [Temp or '--']
-                Diagnosis: [Diagnosis in English]
-                Rx: [Medication List in English]
-                Notes: [Clinical Remarks in English]
-                """
-                
-                res = client.chat.completions.create(
-                    model="llama-3.3-70b-versatile",
-                    messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": transcription}],
-                    temperature=0.0
-                )
-                
-                raw_data = clean_text_forcefully(res.choices[0].message.content)
-                lines = raw_data.split('\n')
-                rx_lines = []
-                
-                for line in lines:
-                    line = line.strip()
-                    if not line: continue
-                    if line.startswith("Name:"): st.session_state.v_name = line.replace("Name:", "").strip()
-                    elif line.startswith("Patient Name:"): st.session_state.v_name = line.replace("Patient Name:", "").strip()
-                    elif line.startswith("Age:"): st.session_state.v_age = line.replace("Age:", "").strip()
-                    elif line.startswith("BP:"): st.session_state.v_bp = line.replace("BP:", "").strip()
-                    elif line.startswith("Pulse:"): st.session_state.v_pulse = line.replace("Pulse:", "").strip()
-                    elif line.startswith("Weight:"): st.session_state.v_weight = line.replace("Weight:", "").strip()
-                    elif line.startswith("Temp:"): st.session_state.v_temp = line.replace("Temp:", "").strip()
-                    elif line.startswith("Notes:"): st.session_state.draft_notes = line.replace("Notes:", "").strip()
-                    else: rx_lines.append(line)
-                
-                st.session_state.draft_rx = "\n".join(rx_lines).strip()
+                fields = analyze_audio(governed(client, st.session_state.doctor_name), audio)
+                st.session_state.v_name = fields["name"] or st.session_state.v_name
+                st.session_state.v_age = fields["age"] or st.session_state.v_age
+                st.session_state.v_bp = fields["bp"] or st.session_state.v_bp
+                st.session_state.v_pulse = fields["pulse"] or st.session_state.v_pulse
+                st.session_state.v_weight = fields["weight"] or st.session_state.v_weight
+                st.session_state.v_temp = fields["temp"] or st.session_state.v_temp
+                st.session_state.draft_notes = fields["notes"] or st.session_state.draft_notes
+                st.session_state.draft_rx = fields["rx"]
+                st.session_state.rx_warnings = fields["rx_warnings"]
                 st.rerun()
                 
         with col2:
@@ -359,6 +199,22 @@ else:
             st.markdown("### 3. Prescription & Notes")
             if st.session_state.draft_rx or st.session_state.draft_notes:
                 body = st.text_area("Prescription Draft", st.session_state.draft_rx, height=250)
+                for warning in st.session_state.rx_warnings: st.warning(f"💊 {warning}")
+
+                f1, f2 = st.columns([3, 1])
+                drug_q = f1.text_input("💊 Formulary Lookup", placeholder="Start typing a drug, e.g. amlo")
+                matches = suggest(drug_q) if drug_q.strip() else []
+                if matches:
+                    options = [f"{name} {strength}" for name, strengths, form in matches for strength in (strengths or ("",))]
+                    pick = f1.selectbox("Matches", options, label_visibility="collapsed")
+                    if f2.button("➕ Add to Rx"):
+                        st.session_state.draft_rx = (body.rstrip() + "\n" + pick.strip()).strip()
+                        st.rerun()
+                elif drug_q.strip():
+                    f1.caption("No formulary match.")
+                if f2.button("🧹 Normalize Rx"):
+                    st.session_state.draft_rx, st.session_state.rx_warnings = normalize_rx(body)
+                    st.rerun()
                 notes = st.text_area("👨‍⚕️ Clinical Notes", st.session_state.draft_notes, height=100)
                 
                 vitals_clean = {
@@ -374,6 +230,7 @@ else:
                     def save_and_clear():
                         save_data(st.session_state.doctor_name, clean_text_forcefully(st.session_state.v_name), st.session_state.v_age, "See Rx", body, notes, st.session_state.v_bp, st.session_state.v_pulse, st.session_state.v_weight, st.session_state.v_temp)
                         st.session_state.draft_rx = "" 
+                        st.session_state.rx_warnings = []
                         st.session_state.v_name = ""
                         st.success("Archived!")
                     
@@ -383,8 +240,49 @@ else:
 
     elif menu == "Archive & Records":
         st.header("📂 Archives")
+
+        with st.expander("📦 Export Visits"):
+            x1, x2, x3 = st.columns(3)
+            x_start = x1.date_input("From", value=None, key="exp_start")
+            x_end = x2.date_input("To", value=None, key="exp_end")
+            x_fmt = x3.selectbox("Format", list(FORMATS), format_func=lambda f: f.upper(), key="exp_fmt")
+            def discard_export():
+                # The spooled file is full PHI: remove it as soon as it has been handed out
+                path = st.session_state.pop("export_path", None)
+                if path and os.path.exists(path): os.remove(path)
+
+            if st.button("Prepare Export"):
+                discard_export()
+                try:
+                    # The download button keeps the file in memory, so browser exports are capped
+                    st.session_state.export_path = spool_export(
+                        x_fmt,
+                        x_start.strftime("%Y-%m-%d") if x_start else None,
+                        x_end.strftime("%Y-%m-%d") if x_end else None,
+                        max_bytes=UI_EXPORT_MAX_BYTES
+                    )
+                    st.session_state.export_fmt = x_fmt
+                except ValueError as e:
+                    st.error(str(e))
+            if st.session_state.get("export_path") and os.path.exists(st.session_state.export_path):
+                mime, ext = FORMATS[st.session_state.export_fmt]
+                with open(st.session_state.export_path, "rb") as f:
+                    st.download_button("⬇️ Download Export", f, file_name=f"asclepius_export.{ext}", mime=mime, on_click=discard_export)
+
         df = load_data()
-        
+
+        h1, h2 = st.columns([3, 1])
+        q_name = h1.text_input("🔎 Patient History", placeholder="e.g. Ramesh Kumar", key="hist_name")
+        q_age = h2.text_input("Age", key="hist_age")
+        if q_name.strip():
+            pid = find_patient(q_name, q_age)
+            if pid:
+                st.caption(f"Patient {pid}: {patient_visits(pid)} visit(s) on record")
+                df = df[df["Patient ID"] == pid]
+            else:
+                st.warning("No matching patient found.")
+                df = df.iloc[0:0]
+
         if not df.empty:
             c1, c2, c3, c4 = st.columns([2, 2, 4, 3])
             c1.markdown("<div class='grid-header'>DATE</div>", unsafe_allow_html=True)
@@ -400,6 +298,7 @@ else:
                 c2.write(f"🕒 {row['Time']}")
                 age_display = f"(Age: {clean_nan(row['Age'])})" if clean_nan(row['Age']) != "--" else ""
                 c3.markdown(f"**{clean_nan(row['Patient Name'])}** {age_display}")
+                if clean_nan(row['Patient ID']) != "--": c3.caption(f"ID {row['Patient ID']}")
                 
                 with c4:
                     b1, b2 = st.columns(2)
@@ -450,6 +349,14 @@ else:
             with c1:
                 st.subheader("Patient Traffic")
                 st.line_chart(df['Date'].value_counts().sort_index(), color="#D4AF37")
+            with c2:
+                st.subheader("AI Request Queue")
+                q = get_governor().snapshot()
+                q1, q2, q3 = st.columns(3)
+                q1.metric("In Flight", q["in_flight"])
+                q2.metric("Queued", q["queued"], help=f"Peak: {q['max_queue_depth']}")
+                q3.metric("Avg Wait", f"{q['avg_wait_s']}s")
+                st.caption(f"Retries: {q['retries']} | Rate-limited: {q['throttled']} | Server errors: {q['server_errors']} | Failed: {q['failed']}")
 
     elif menu == "Settings":
         st.header("⚙️ Settings")